@@ -4,7 +4,14 @@ from api.models import *
 
 
 admin.site.register(Otp)
+admin.site.register(OtpOutbox)
 admin.site.register(User)
-admin.site.register(Client)
+admin.site.register(RevokedToken)
 admin.site.register(Individual)
-admin.site.register(LegalEntity)
\ No newline at end of file
+admin.site.register(LegalEntity)
+
+
+@admin.register(Client)
+class ClientAdmin(admin.ModelAdmin):
+    list_display = ["id", "fullname", "user", "client_type", "details"]
+    list_select_related = ["user", "individual", "legal_entity"]
@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
+
+
+def repair_search_index(using, **kwargs):
+    from django.db import connections
+    from api.search import get_project_search
+    get_project_search(connections[using]).repair()
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from api.authentication import connect_user_signals
+        from api.blobs import connect_blob_signals
+        from api.models import FreelancerCategory, ProjectCategory, ProjectFile, ProjectPhoto, TempFile, User
+        from api.slow_queries import connect_slow_query_log
+        from api.sms import check_sms_backend
+        from api.trees import connect_tree_signals
+        from api.variants import connect_variant_signals
+
+        checks.register(check_sms_backend, checks.Tags.security, deploy=True)
+        post_migrate.connect(repair_search_index, sender=self)
+        connect_tree_signals(ProjectCategory, FreelancerCategory)
+        connect_user_signals(User)
+        connect_blob_signals(TempFile, ProjectFile, ProjectPhoto)
+        connect_variant_signals(ProjectPhoto)
+        connect_slow_query_log()
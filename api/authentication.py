@@ -0,0 +1,156 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+USER_KEY = "auth-user:{}"
+EPOCH_KEY = "auth-epoch:{}"
+
+
+CLAIMED_FIELDS = ["phone", "is_staff", "is_superuser", "is_active"]
+# Changing any of these ends the sessions issued so far
+SESSION_FIELDS = CLAIMED_FIELDS + ["password"]
+
+
+def user_claims(user):
+    return {field: getattr(user, field) for field in CLAIMED_FIELDS}
+
+
+def session_state(user):
+    # Read from __dict__ so deferred fields are not loaded
+    return tuple(user.__dict__.get(field) for field in SESSION_FIELDS)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the claims ClaimsJWTAuthentication builds users
+    from. They are copied to every access token minted from it.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class ClaimsUser:
+    """
+    request.user built from token claims. Anything besides the claims is
+    read from the full User, which is loaded on first use and kept in the
+    local cache for AUTH_USER_CACHE_TIMEOUT seconds.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        self.token = token
+        self.id = self.pk = token[api_settings.USER_ID_CLAIM]
+        self.phone = token["phone"]
+        self.is_staff = token.get("is_staff", False)
+        self.is_superuser = token.get("is_superuser", False)
+        self.is_active = token.get("is_active", True)
+        self._user = None
+
+    def __str__(self):
+        return self.phone
+
+    def __eq__(self, other):
+        return getattr(other, "pk", None) == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    @property
+    def username(self):
+        return self.phone
+
+    def get_user(self):
+        if self._user is None:
+            from api.models import User
+
+            local = caches[settings.AUTH_USER_CACHE_ALIAS]
+            user = local.get(USER_KEY.format(self.pk))
+            if user is None:
+                try:
+                    user = User.objects.get(pk=self.pk)
+                except User.DoesNotExist:
+                    raise AuthenticationFailed(_("User not found"), code="user_not_found")
+                local.set(USER_KEY.format(self.pk), user, settings.AUTH_USER_CACHE_TIMEOUT)
+            self._user = user
+        return self._user
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Authenticates without a user query. Changing a claimed field or the
+    password of a user stores an epoch in the default cache, tokens issued
+    before it are rejected. The cache has to be shared by every worker
+    (CACHE_URL) for this to reach all of them.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        if "phone" not in validated_token:
+            # Issued before the claims were added
+            return super().get_user(validated_token)
+
+        if is_superseded(validated_token):
+            raise AuthenticationFailed(_("Token is invalid or expired"), code="token_not_valid")
+        if not validated_token.get("is_active", True):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return ClaimsUser(validated_token)
+
+
+def is_superseded(token):
+    """
+    Whether the token was issued before its user was last saved.
+    """
+    epoch = cache.get(EPOCH_KEY.format(token.get(api_settings.USER_ID_CLAIM)))
+    return epoch is not None and token.get("iat", 0) < epoch
+
+
+def remember_session_state(sender, instance, **kwargs):
+    instance._session_state = session_state(instance)
+
+
+def end_sessions(user):
+    # Refresh tokens live the longest, the epoch is not needed after that
+    timeout = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+    cache.set(EPOCH_KEY.format(user.pk), int(time.time()), timeout)
+
+
+def invalidate_user(sender, instance, created=False, **kwargs):
+    caches[settings.AUTH_USER_CACHE_ALIAS].delete(USER_KEY.format(instance.pk))
+    state = session_state(instance)
+    # Saves that leave the claims alone, like last_login updates, keep the sessions
+    if not created and state != getattr(instance, "_session_state", None):
+        end_sessions(instance)
+    instance._session_state = state
+
+
+def invalidate_deleted_user(sender, instance, **kwargs):
+    caches[settings.AUTH_USER_CACHE_ALIAS].delete(USER_KEY.format(instance.pk))
+    end_sessions(instance)
+
+
+def connect_user_signals(model):
+    from django.db.models.signals import post_delete, post_init, post_save
+
+    post_init.connect(remember_session_state, sender=model)
+    post_save.connect(invalidate_user, sender=model)
+    post_delete.connect(invalidate_deleted_user, sender=model)
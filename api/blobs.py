@@ -0,0 +1,135 @@
+import os
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.storage import content_storage
+
+
+def acquire(names):
+    from api.models import Blob
+
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    Blob.objects.bulk_create([Blob(name=name) for name in counts], ignore_conflicts=True)
+    groups = defaultdict(list)
+    for name, count in counts.items():
+        groups[count].append(name)
+    for count, group in groups.items():
+        Blob.objects.filter(name__in=group).update(references=F("references") + count, updated_at=timezone.now())
+
+
+def release(names):
+    from api.models import Blob
+
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    groups = defaultdict(list)
+    for name, count in counts.items():
+        groups[count].append(name)
+    for count, group in groups.items():
+        Blob.objects.filter(name__in=group).update(references=F("references") - count, updated_at=timezone.now())
+    released = list(counts)
+    transaction.on_commit(lambda: delete_unreferenced(released))
+
+
+def delete_unreferenced(names, grace=None):
+    """
+    Deletes the files of blobs nobody references any more and returns the
+    number of bytes reclaimed. Files written within the grace period are
+    kept, an upload of the same content may be about to reference them.
+    """
+    from api.models import Blob
+
+    if grace is None:
+        grace = settings.BLOB_DELETE_GRACE
+    cutoff = time.time() - grace
+    reclaimed = 0
+    for name in names:
+        with transaction.atomic():
+            # The conditional delete re-checks the count and holds the row
+            # lock until the file is gone, acquire() of the same name waits
+            deleted, _ = Blob.objects.filter(name=name, references__lte=0).delete()
+            if not deleted:
+                continue
+            size = remove_blob_file(name, cutoff)
+            if size is None:
+                # Keep the row for a later pass
+                transaction.set_rollback(True)
+                continue
+            reclaimed += size + delete_variants(name)
+    return reclaimed
+
+
+def remove_blob_file(name, cutoff):
+    """
+    Removes the file of a blob unless it was written after `cutoff`. Returns
+    the bytes reclaimed, or None when the file was kept.
+
+    The file is renamed away before its mtime is checked, so a save of the
+    same content landing meanwhile is either the file checked, and put back,
+    or a new file the removal does not touch.
+    """
+    path = content_storage.path(name)
+    moved = os.path.join(os.path.dirname(path), ".partial-" + os.path.basename(path))
+    try:
+        os.replace(path, moved)
+    except FileNotFoundError:
+        return 0
+    stat = os.stat(moved)
+    if stat.st_mtime > cutoff:
+        # Blobs with one name have the same content, replacing a newer copy is harmless
+        os.replace(moved, path)
+        return None
+    os.remove(moved)
+    return stat.st_size
+
+
+def delete_variants(name):
+    from api.variants import variant_names
+
+    reclaimed = 0
+    for variant in variant_names(name):
+        path = content_storage.path(variant)
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        reclaimed += size
+    return reclaimed
+
+
+def remember_previous_name(sender, instance, **kwargs):
+    field = sender.BLOB_FIELD
+    previous = None
+    if not instance._state.adding:
+        previous = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    instance._blob_previous = previous
+
+
+def reference_saved_name(sender, instance, **kwargs):
+    name = getattr(instance, sender.BLOB_FIELD).name
+    previous = instance.__dict__.pop("_blob_previous", None)
+    if name != previous:
+        acquire([name])
+        release([previous])
+
+
+def dereference_deleted_name(sender, instance, **kwargs):
+    release([getattr(instance, sender.BLOB_FIELD).name])
+
+
+def connect_blob_signals(*models):
+    from django.db.models.signals import post_delete, post_save, pre_save
+
+    for model in models:
+        pre_save.connect(remember_previous_name, sender=model)
+        post_save.connect(reference_saved_name, sender=model)
+        post_delete.connect(dereference_deleted_name, sender=model)
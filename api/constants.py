@@ -8,4 +8,6 @@ WORKER_TYPE = [
     ("freelancer", _("Freelancer")),
     ("team", _("Team")),
     ("company", _("Company"))
-]
\ No newline at end of file
+]
+
+OTP_SMS_TEXT = "Teamwork: {code}"
@@ -1,6 +1,19 @@
 USER_DOES_NOT_EXIST = "USER_DOES_NOT_EXIST"
 INCORRECT_PASSWORD = "INCORRECT_PASSWORD"
+LOGIN_BUSY = "LOGIN_BUSY"
 
 OTP_EXPIRED = "OTP_EXPIRED"
 WRONG_OTP_CODE = "WRONG_OTP_CODE"
-OTP_NOT_FOUND = "OTP_NOT_FOUND"
\ No newline at end of file
+OTP_NOT_FOUND = "OTP_NOT_FOUND"
+OTP_ATTEMPTS_EXCEEDED = "OTP_ATTEMPTS_EXCEEDED"
+
+UPLOAD_OFFSET_MISMATCH = "UPLOAD_OFFSET_MISMATCH"
+UPLOAD_TOO_LARGE = "UPLOAD_TOO_LARGE"
+UPLOAD_INCOMPLETE = "UPLOAD_INCOMPLETE"
+UPLOAD_CHECKSUM_MISMATCH = "UPLOAD_CHECKSUM_MISMATCH"
+UPLOAD_ALREADY_COMPLETE = "UPLOAD_ALREADY_COMPLETE"
+
+PHOTO_UNREADABLE = "PHOTO_UNREADABLE"
+PHOTO_VARIANT_UNAVAILABLE = "PHOTO_VARIANT_UNAVAILABLE"
+
+EXPORT_UNKNOWN_FORMAT = "EXPORT_UNKNOWN_FORMAT"
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+import zlib
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api.models import Client, Individual, LegalEntity, Project
+
+
+PROJECT_FIELDS = [
+    "id", "title", "description", "status", "worker_type", "price", "price_negotiatable", "deadline",
+    "deadline_negotiatable", "pro_task", "client_id", "project_category_id", "freelancer_category_id",
+    "created_at", "updated_at",
+]
+CLIENT_FIELDS = ["id", "fullname", "client_type", "balance", "coins", "created_at", "updated_at"]
+INDIVIDUAL_FIELDS = [
+    "fullname", "email", "passport_series", "passport_number", "passport_given_date", "passport_issued_address",
+    "country", "region", "city", "address",
+]
+LEGAL_ENTITY_FIELDS = [
+    "fullname", "company", "bank_name", "bank_account", "mfo", "inn", "ifut", "country", "region", "city",
+    "post_code", "address", "telegram_phone", "email",
+]
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def chunks(queryset, fields, chunk_size):
+    """
+    Yields lists of up to `chunk_size` rows as dicts. The rows are read
+    through iterator(), so at most one chunk is held in memory.
+    """
+    rows = queryset.order_by("id").values(*fields).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def project_chunks(queryset, chunk_size):
+    through = Project.tags.through
+    content_type = ContentType.objects.get_for_model(Project)
+    for chunk in chunks(queryset, PROJECT_FIELDS, chunk_size):
+        # One query for the tags of the whole chunk
+        tags = defaultdict(list)
+        tagged = through.objects.filter(content_type=content_type, object_id__in=[row["id"] for row in chunk]) \
+            .order_by("object_id", "tag__name").values_list("object_id", "tag__name")
+        for object_id, name in tagged:
+            tags[object_id].append(name)
+        for row in chunk:
+            row["tags"] = tags[row["id"]]
+        yield chunk
+
+
+def client_chunks(queryset, chunk_size):
+    for chunk in chunks(queryset, CLIENT_FIELDS + ["user__phone"], chunk_size):
+        ids = [row["id"] for row in chunk]
+        # One query per details table for the whole chunk
+        individuals = {
+            row.pop("client_id"): row
+            for row in Individual.objects.filter(client_id__in=ids).values("client_id", *INDIVIDUAL_FIELDS)
+        }
+        legal_entities = {
+            row.pop("client_id"): row
+            for row in LegalEntity.objects.filter(client_id__in=ids).values("client_id", *LEGAL_ENTITY_FIELDS)
+        }
+        for row in chunk:
+            row["phone"] = row.pop("user__phone")
+            row["individual"] = individuals.get(row["id"])
+            row["legal_entity"] = legal_entities.get(row["id"])
+        yield chunk
+
+
+def export_rows(kind, queryset=None, chunk_size=None):
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    if kind == "projects":
+        return project_chunks(queryset if queryset is not None else Project.objects.all(), chunk_size)
+    return client_chunks(queryset if queryset is not None else Client.objects.all(), chunk_size)
+
+
+def ndjson(row_chunks):
+    for chunk in row_chunks:
+        yield "".join(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n" for row in chunk)
+
+
+def flatten(row, prefix=""):
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, "{}{}.".format(prefix, key)))
+        elif isinstance(value, list):
+            flat[prefix + key] = ",".join(str(item) for item in value)
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def escape_formula(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_columns(kind):
+    if kind == "projects":
+        return PROJECT_FIELDS + ["tags"]
+    return (
+        CLIENT_FIELDS + ["phone"]
+        + ["individual.{}".format(field) for field in INDIVIDUAL_FIELDS]
+        + ["legal_entity.{}".format(field) for field in LEGAL_ENTITY_FIELDS]
+    )
+
+
+def csv_text(kind, row_chunks):
+    columns = csv_columns(kind)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, columns, extrasaction="ignore")
+    writer.writeheader()
+    for chunk in row_chunks:
+        for row in chunk:
+            writer.writerow({key: escape_formula(value) for key, value in flatten(row).items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def render(kind, output, row_chunks):
+    if output == "csv":
+        return csv_text(kind, row_chunks)
+    return ndjson(row_chunks)
+
+
+def gzipped(pieces):
+    """
+    Compresses a stream of text pieces on the fly into one gzip member.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        data = compressor.compress(piece.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(kind, output, gzip=False, queryset=None, chunk_size=None):
+    """
+    Iterable of the export as str pieces, or bytes when gzipped, one piece
+    per chunk of rows.
+    """
+    pieces = render(kind, output, export_rows(kind, queryset, chunk_size))
+    return gzipped(pieces) if gzip else pieces
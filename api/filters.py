@@ -0,0 +1,47 @@
+from django_filters import rest_framework as filters
+
+from api.constants import WORKER_TYPE
+from api.models import FreelancerCategory, Project, ProjectCategory
+
+
+class ProjectFilter(filters.FilterSet):
+    status = filters.MultipleChoiceFilter(choices=Project.STATUS)
+    worker_type = filters.MultipleChoiceFilter(choices=WORKER_TYPE)
+    price_min = filters.NumberFilter(field_name="price", lookup_expr="gte")
+    price_max = filters.NumberFilter(field_name="price", lookup_expr="lte")
+    deadline_after = filters.DateFilter(field_name="deadline", lookup_expr="gte")
+    deadline_before = filters.DateFilter(field_name="deadline", lookup_expr="lte")
+    pro_task = filters.BooleanFilter()
+    tags = filters.BaseInFilter(method="filter_tags", help_text="Comma separated tag names, any of them matches")
+    project_category = filters.NumberFilter(method="filter_project_category", help_text="Category ID, includes subcategories")
+    freelancer_category = filters.NumberFilter(method="filter_freelancer_category", help_text="Category ID, includes subcategories")
+
+    class Meta:
+        model = Project
+        fields = []
+
+    def filter_tags(self, queryset, name, value):
+        through = Project.tags.through
+        tagged = through.objects.filter(
+            content_type__app_label=Project._meta.app_label,
+            content_type__model=Project._meta.model_name,
+            tag__name__in=value,
+        ).values("object_id")
+        return queryset.filter(id__in=tagged)
+
+    def filter_subtree(self, queryset, field, model, value):
+        # Match the MPTT range of the node instead of expanding descendant IDs
+        node = model.objects.filter(pk=value).values("tree_id", "lft", "rght").first()
+        if node is None:
+            return queryset.none()
+        return queryset.filter(**{
+            "{}__tree_id".format(field): node["tree_id"],
+            "{}__lft__gte".format(field): node["lft"],
+            "{}__rght__lte".format(field): node["rght"],
+        })
+
+    def filter_project_category(self, queryset, name, value):
+        return self.filter_subtree(queryset, "project_category", ProjectCategory, value)
+
+    def filter_freelancer_category(self, queryset, name, value):
+        return self.filter_subtree(queryset, "freelancer_category", FreelancerCategory, value)
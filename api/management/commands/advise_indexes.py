@@ -0,0 +1,228 @@
+import json
+import os
+import re
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+PREDICATE = re.compile(r'"(\w+)"\."(\w+)"\s*(<=|>=|<>|!=|=|<|>|IN\b|LIKE\b|IS\b|BETWEEN\b)', re.IGNORECASE)
+ORDER_COLUMN = re.compile(r'"(\w+)"\."(\w+)"(?:\s+(ASC|DESC))?', re.IGNORECASE)
+CLAUSE_END = re.compile(r"\b(GROUP BY|HAVING|ORDER BY|LIMIT|OFFSET)\b", re.IGNORECASE)
+ORDER_END = re.compile(r"\b(LIMIT|OFFSET)\b", re.IGNORECASE)
+EQUALITY = {"=", "IN", "IS"}
+
+
+def sequential_scans(plan):
+    tables = set()
+    for row in plan or []:
+        # SQLite: "SCAN api_project", but "SCAN api_project USING INDEX ..." walks an index
+        match = re.search(r"\bSCAN (?:TABLE )?(\w+)(.*)", row)
+        if match and "USING" not in match.group(2).upper():
+            tables.add(match.group(1))
+        # PostgreSQL
+        match = re.search(r"Seq Scan on (\w+)", row)
+        if match:
+            tables.add(match.group(1))
+    return tables
+
+
+def sorts_rows(plan):
+    # The rows are sorted after the lookup instead of read in index order
+    return any("TEMP B-TREE FOR ORDER BY" in row or "Sort Key" in row for row in plan or [])
+
+
+def outer_level(sql):
+    """
+    The statement with everything inside parentheses and quotes blanked
+    out, so keywords found in it belong to the outermost statement and
+    their positions match the original.
+    """
+    masked = []
+    depth = 0
+    quote = None
+    for char in sql:
+        if quote:
+            if char == quote:
+                quote = None
+            masked.append(" ")
+        elif char in "'\"":
+            quote = char
+            masked.append(" ")
+        elif char == "(":
+            depth += 1
+            masked.append(" ")
+        elif char == ")":
+            depth -= 1
+            masked.append(" ")
+        else:
+            masked.append(char if depth == 0 else " ")
+    return "".join(masked).upper()
+
+
+def split_clauses(sql):
+    """
+    Returns the WHERE and ORDER BY parts of the outermost statement.
+    Subqueries inside the WHERE part are kept, their predicates name their
+    own tables.
+    """
+    outer = outer_level(sql)
+    where = order = ""
+    position = outer.find(" WHERE ")
+    if position != -1:
+        start = position + 7
+        end = CLAUSE_END.search(outer, start)
+        where = sql[start:end.start() if end else len(sql)]
+    position = outer.rfind(" ORDER BY ")
+    if position != -1:
+        start = position + 10
+        end = ORDER_END.search(outer, start)
+        order = sql[start:end.start() if end else len(sql)]
+    return where, order
+
+
+def candidate_indexes(sql):
+    """
+    Column lists an index would need to serve the query, per table:
+    equality columns first, then one range column or the sort columns.
+    """
+    where, order = split_clauses(sql)
+    equality = defaultdict(list)
+    ranges = defaultdict(list)
+    for table, column, operator in PREDICATE.findall(where):
+        target = equality if operator.upper() in EQUALITY else ranges
+        if column not in target[table]:
+            target[table].append(column)
+    sorting = defaultdict(list)
+    for table, column, _ in ORDER_COLUMN.findall(order):
+        if column not in sorting[table]:
+            sorting[table].append(column)
+
+    candidates = {}
+    for table in set(equality) | set(ranges):
+        columns = sorted(equality[table])
+        if ranges[table]:
+            columns.append(ranges[table][0])
+        else:
+            columns.extend(column for column in sorting[table] if column not in columns)
+        candidates[table] = (tuple(columns), len(equality[table]))
+    return candidates
+
+
+def is_covered(columns, equal_count, indexes, ordered):
+    """
+    An index covers a candidate when it starts with all of its equality
+    columns, in any order, filtering the rest after the lookup is cheap.
+    Without equality columns it has to start with the range or sort column.
+    When the plan sorted the rows, the index has to continue with the sort
+    columns so they can be read in order.
+    """
+    equal = set(columns[:equal_count])
+    rest = list(columns[equal_count:])
+    for index in indexes:
+        if ordered and rest:
+            if set(index[:equal_count]) == equal and index[equal_count:len(columns)] == rest:
+                return True
+        elif equal and set(index[:equal_count]) == equal:
+            return True
+        elif not equal and index and index[0] == columns[0]:
+            return True
+    return False
+
+
+class Command(BaseCommand):
+    help = "Suggests indexes from the predicates and sequential scans in the slow query log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--log", default=None, help="Slow query log, SLOW_QUERY_LOG by default")
+        parser.add_argument("--table", action="append", help="Only these tables, e.g. api_project")
+        parser.add_argument("--min-queries", type=int, default=1, help="Skip candidates seen fewer times")
+
+    def handle(self, *args, **options):
+        path = options["log"] or settings.SLOW_QUERY_LOG
+        paths = [p for p in (path + ".1", path) if os.path.exists(p)]
+        if not paths:
+            raise CommandError("No slow query log at {}".format(path))
+
+        seen = defaultdict(lambda: {"queries": 0, "duration": 0.0, "scans": 0, "sorts": 0, "views": set()})
+        scans = defaultdict(int)
+        entries = 0
+        for p in paths:
+            with open(p) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries += 1
+                    scanned = sequential_scans(entry.get("plan"))
+                    ordered = sorts_rows(entry.get("plan"))
+                    for table in scanned:
+                        scans[table] += 1
+                    for table, candidate in candidate_indexes(entry["sql"]).items():
+                        if options["table"] and table not in options["table"]:
+                            continue
+                        columns, equal_count = candidate
+                        # A primary key lookup is as selective as it gets
+                        if not columns or "id" in columns[:equal_count] or columns == ("id",):
+                            continue
+                        data = seen[table, candidate]
+                        data["queries"] += 1
+                        data["duration"] += entry["duration"]
+                        data["scans"] += table in scanned
+                        data["sorts"] += ordered
+                        data["views"].add(entry.get("view") or entry.get("origin") or "unknown")
+
+        self.stdout.write("{} slow queries read".format(entries))
+        existing = {}
+        present = {}
+        suggestions = []
+        with connection.cursor() as cursor:
+            tables = set(connection.introspection.table_names(cursor))
+            for (table, (columns, equal_count)), data in seen.items():
+                if table not in tables or data["queries"] < options["min_queries"]:
+                    continue
+                if table not in existing:
+                    constraints = connection.introspection.get_constraints(cursor, table)
+                    existing[table] = [
+                        constraint["columns"] for constraint in constraints.values()
+                        if constraint["index"] or constraint["primary_key"] or constraint["unique"]
+                    ]
+                    present[table] = {
+                        column.name for column in connection.introspection.get_table_description(cursor, table)
+                    }
+                # Queries logged before a migration may name columns that are gone
+                if not set(columns) <= present[table]:
+                    continue
+                if not is_covered(columns, equal_count, existing[table], data["sorts"] > 0):
+                    suggestions.append((table, columns, data))
+
+        if not suggestions:
+            self.stdout.write("Every predicate seen is served by an existing index")
+        for table, columns, data in sorted(suggestions, key=lambda item: item[2]["duration"], reverse=True):
+            self.stdout.write("\n{} ({}): {} queries, {:.0f} ms in total, {} sequential scans, {} sorts".format(
+                table, ", ".join(columns), data["queries"], data["duration"], data["scans"], data["sorts"]
+            ))
+            self.stdout.write("  from {}".format(", ".join(sorted(data["views"]))))
+            self.stdout.write("  {}".format(self.index_definition(table, columns)))
+
+        unexplained = {
+            table: count for table, count in scans.items()
+            if table in tables and (not options["table"] or table in options["table"]) and not any(t == table for t, _, _ in suggestions)
+        }
+        if unexplained:
+            self.stdout.write("\nOther tables read with sequential scans:")
+            for table, count in sorted(unexplained.items(), key=lambda item: -item[1]):
+                self.stdout.write("  {}: {}".format(table, count))
+
+    def index_definition(self, table, columns):
+        for model in apps.get_models(include_auto_created=True):
+            if model._meta.db_table != table:
+                continue
+            names = {field.column: field.name for field in model._meta.concrete_fields}
+            fields = ", ".join('"{}"'.format(names.get(column, column)) for column in columns)
+            return "{}.Meta.indexes: models.Index(fields=[{}])".format(model._meta.label, fields)
+        return "CREATE INDEX ON {} ({})".format(table, ", ".join(columns))
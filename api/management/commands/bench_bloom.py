@@ -0,0 +1,43 @@
+import sys
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from api.revocation import BloomFilter
+
+
+class Command(BaseCommand):
+    help = "Measures memory, speed and false positive rate of the revoked token Bloom filter"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10000000, help="Revoked tokens to insert")
+        parser.add_argument("--error-rate", type=float, default=0.01)
+        parser.add_argument("--probes", type=int, default=1000000, help="Unrevoked tokens to look up")
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        bloom = BloomFilter(count, options["error_rate"])
+        self.stdout.write("{} bits, {} hashes: {:.1f} MiB for {} tokens".format(
+            bloom.size, bloom.hashes, bloom.nbytes / 2 ** 20, count
+        ))
+
+        # Token IDs are uuid4 hex strings, as simplejwt issues them
+        started = time.perf_counter()
+        for _ in range(count):
+            bloom.add(uuid.uuid4().hex)
+        elapsed = time.perf_counter() - started
+        self.stdout.write("insert: {:.1f}s ({:.2f}us per token)".format(elapsed, elapsed * 1e6 / count))
+
+        probes = options["probes"]
+        started = time.perf_counter()
+        hits = sum(1 for _ in range(probes) if uuid.uuid4().hex in bloom)
+        elapsed = time.perf_counter() - started
+        self.stdout.write("lookup: {:.2f}us per token, false positives {} of {} ({:.3%}, target {:.3%})".format(
+            elapsed * 1e6 / probes, hits, probes, hits / probes, options["error_rate"]
+        ))
+
+        # What a set of the same IDs would take, extrapolated from a sample
+        sample = {uuid.uuid4().hex for _ in range(100000)}
+        per_item = (sys.getsizeof(sample) + sum(sys.getsizeof(jti) for jti in sample)) / len(sample)
+        self.stdout.write("a set of {} IDs would need about {:.0f} MiB".format(count, per_item * count / 2 ** 20))
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client as TestClient
+
+from api.models import User
+
+
+PHONE_PREFIX = "99800"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Measures POST /api/token/ latency under concurrent logins"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--concurrency", type=int, default=16)
+
+    def free_phones(self, count):
+        taken = set(User.objects.filter(phone__startswith=PHONE_PREFIX).values_list("phone", flat=True))
+        phones = []
+        number = 0
+        while len(phones) < count:
+            phone = "{}{:07d}".format(PHONE_PREFIX, number)
+            if phone not in taken:
+                phones.append(phone)
+            number += 1
+        return phones
+
+    def handle(self, *args, **options):
+        password = "bench-password"
+        encoded = make_password(password)
+        phones = self.free_phones(options["users"])
+        User.objects.bulk_create([User(phone=phone, password=encoded) for phone in phones])
+        # Only the users created here are deleted afterwards
+        created = list(User.objects.filter(phone__in=phones).values_list("id", flat=True))
+
+        def login(i):
+            client = TestClient()
+            started = time.perf_counter()
+            response = client.post("/api/token/", {"phone": phones[i % len(phones)], "password": password})
+            elapsed = (time.perf_counter() - started) * 1000
+            connection.close()
+            return elapsed, response.status_code, response.json().get("status")
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                results = list(executor.map(login, range(options["requests"])))
+            wall = time.perf_counter() - started
+        finally:
+            User.objects.filter(id__in=created).delete()
+
+        timings = [elapsed for elapsed, code, ok in results if code == 200 and ok]
+        busy = sum(1 for _, code, _ in results if code == 503)
+        errors = len(results) - len(timings) - busy
+        self.stdout.write("{} logins, concurrency {}: {:.0f} req/s".format(
+            len(results), options["concurrency"], len(results) / wall
+        ))
+        if timings:
+            self.stdout.write("p50 {:.1f}ms  p90 {:.1f}ms  p99 {:.1f}ms".format(
+                percentile(timings, 0.5), percentile(timings, 0.9), percentile(timings, 0.99)
+            ))
+        self.stdout.write("rejected as busy: {}, errors: {}".format(busy, errors))
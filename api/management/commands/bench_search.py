@@ -0,0 +1,100 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from api.models import Project
+from api.search import get_project_search
+
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "to", "sa", "bu", "de", "ni", "vo", "ro", "zu", "ta", "ma", "po"]
+
+WORDS = [
+    "ilova", "sayt", "dizayn", "logotip", "mobil", "dastur", "tarjima", "maqola", "video", "montaj",
+    "marketing", "reklama", "hisobot", "buxgalteriya", "server", "baza", "android", "telegram", "bot", "dokon",
+    "разработка", "сайт", "дизайн", "логотип", "приложение", "перевод", "статья", "видео", "монтаж", "реклама",
+    "бухгалтерия", "сервер", "магазин", "бот", "интеграция", "верстка", "тестирование", "поддержка", "анализ", "отчет",
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Benchmarks project full-text search against a synthetic corpus"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000, help="Synthetic projects to index")
+        parser.add_argument("--queries", type=int, default=200, help="Queries to time")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic projects instead of rolling back")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        # Common real words plus a long tail of generated ones with a
+        # Zipf-like distribution, so queries hit realistic selectivities
+        generated = set()
+        while len(generated) < 20000:
+            generated.add("".join(self.random.choice(SYLLABLES) for _ in range(self.random.randint(2, 4))))
+        self.vocabulary = WORDS + sorted(generated)
+        self.weights = []
+        total = 0
+        for rank in range(len(self.vocabulary)):
+            total += 1 / (rank + 1)
+            self.weights.append(total)
+        try:
+            with transaction.atomic():
+                self.run(options)
+                if not options["keep"]:
+                    raise Rollback()
+        except Rollback:
+            pass
+
+    def sentence(self, length):
+        return " ".join(self.random.choices(self.vocabulary, cum_weights=self.weights, k=length))
+
+    def run(self, options):
+        started = time.monotonic()
+        batch = []
+        for i in range(options["rows"]):
+            batch.append(Project(title=self.sentence(5), description=self.sentence(60), worker_type="all"))
+            if len(batch) == 5000:
+                Project.objects.bulk_create(batch)
+                batch = []
+        Project.objects.bulk_create(batch)
+        elapsed = time.monotonic() - started
+        self.stdout.write("Inserted and indexed {} projects in {:.1f}s ({:.0f} rows/s)".format(
+            options["rows"], elapsed, options["rows"] / elapsed
+        ))
+
+        backend = get_project_search()
+        queries = [
+            " ".join(self.random.sample(self.vocabulary[:2000], self.random.randint(1, 2)))
+            for _ in range(options["queries"])
+        ]
+        self.report("index", [self.timed(lambda q=q: backend.search(q, "uz", 20, 0)) for q in queries])
+        self.report("icontains scan", [self.timed(lambda q=q: self.scan(q)) for q in queries[:20]])
+
+    def scan(self, query):
+        condition = Q()
+        for term in query.split():
+            condition &= Q(title__icontains=term) | Q(description__icontains=term)
+        return list(Project.objects.filter(condition).order_by("-id")[:20])
+
+    def timed(self, func):
+        started = time.perf_counter()
+        func()
+        return (time.perf_counter() - started) * 1000
+
+    def report(self, name, timings):
+        self.stdout.write("{:<15} p50 {:8.2f}ms  p95 {:8.2f}ms  p99 {:8.2f}ms  ({} queries)".format(
+            name, percentile(timings, 0.5), percentile(timings, 0.95), percentile(timings, 0.99), len(timings)
+        ))
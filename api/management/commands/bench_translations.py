@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from parler_rest.serializers import TranslatableModelSerializer, TranslatedFieldsField
+
+from api.models import ProjectCategory
+from api.serializers import ProjectCategorySerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class RawProjectCategorySerializer(TranslatableModelSerializer):
+    translations = TranslatedFieldsField(shared_model=ProjectCategory)
+
+    class Meta:
+        model = ProjectCategory
+        fields = ["id", "translations", "slug"]
+
+
+class Command(BaseCommand):
+    help = "Measures per-item serialization cost of translated category lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=2000, help="Categories to serialize")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per serializer, the best one is reported")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, options):
+        ProjectCategory.objects.bulk_create([
+            ProjectCategory(slug="category-{}".format(i), lft=0, rght=0, tree_id=i, level=0)
+            for i in range(options["count"])
+        ])
+        categories = list(ProjectCategory.objects.order_by("id"))
+        translation_model = ProjectCategory._parler_meta.root_model
+        translation_model.objects.bulk_create([
+            translation_model(master=category, language_code=language, title="{} {}".format(language, category.slug))
+            for category in categories
+            for language in ("uz", "ru")
+        ])
+
+        request = RequestFactory().get("/", HTTP_ACCEPT_LANGUAGE="ru")
+        for name, serializer_class in (
+            ("parler-rest translations", RawProjectCategorySerializer),
+            ("flattened translation", ProjectCategorySerializer),
+        ):
+            best = None
+            for _ in range(options["repeat"]):
+                instances = list(ProjectCategory.objects.order_by("id").prefetch_related("translations"))
+                started = time.perf_counter()
+                serializer_class(instances, many=True, context={"request": request}).data
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write("{:<26} {:8.1f}us per item ({} items, {:.1f}ms total)".format(
+                name, best * 1e6 / len(instances), len(instances), best * 1000
+            ))
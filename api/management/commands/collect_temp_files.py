@@ -0,0 +1,177 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from api.blobs import delete_unreferenced
+from api.models import Blob, ChunkedUpload, TempFile
+from api.storage import BLOB_ROOT, content_storage
+
+
+TEMP_ROOT = "files/temp"
+
+
+class Command(BaseCommand):
+    help = "Deletes old TempFiles, unreferenced blobs and files under files/temp/ that no row points to"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-age", type=int, default=24, help="Hours a TempFile or stray file is kept")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows or directory entries handled at once")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting it")
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.dry_run = options["dry_run"]
+        self.cutoff = timezone.now() - timezone.timedelta(hours=options["max_age"])
+        self.reclaimed = 0
+        started = time.monotonic()
+
+        self.collect_rows()
+        self.collect_blobs()
+        self.collect_files(TEMP_ROOT, self.unreferenced_temp_files)
+        self.collect_files(BLOB_ROOT, self.unreferenced_blob_files)
+
+        self.stdout.write("{} {:.1f} MiB in {:.1f}s".format(
+            "Would reclaim" if self.dry_run else "Reclaimed",
+            self.reclaimed / 2 ** 20,
+            time.monotonic() - started,
+        ))
+
+    def collect_rows(self):
+        # Deleting a TempFile releases its blob, collect_blobs picks up the rest
+        bounds = TempFile.objects.aggregate(low=Min("pk"), high=Max("pk"))
+        total = 0
+        low = bounds["low"]
+        while low is not None and low <= bounds["high"]:
+            batch = TempFile.objects.filter(pk__gte=low, pk__lt=low + self.batch_size, created_at__lt=self.cutoff)
+            total += batch.count() if self.dry_run else batch.delete()[1].get(TempFile._meta.label, 0)
+            low += self.batch_size
+        self.stdout.write("TempFile rows: {}".format(total))
+
+        # Abandoned uploads leave their partial file behind for the file scan
+        uploads = ChunkedUpload.objects.filter(updated_at__lt=self.cutoff)
+        total = uploads.count() if self.dry_run else 0
+        while not self.dry_run:
+            batch = list(uploads.values_list("pk", flat=True)[:self.batch_size])
+            if not batch:
+                break
+            total += ChunkedUpload.objects.filter(pk__in=batch).delete()[0]
+        self.stdout.write("ChunkedUpload rows: {}".format(total))
+
+    def collect_blobs(self):
+        grace = timezone.now() - timezone.timedelta(seconds=settings.BLOB_DELETE_GRACE)
+        blobs = Blob.objects.filter(references__lte=0, updated_at__lt=grace).order_by("pk")
+        total = 0
+        last = 0
+        while True:
+            batch = list(blobs.filter(pk__gt=last).values_list("pk", "name")[:self.batch_size])
+            if not batch:
+                break
+            last = batch[-1][0]
+            names = [name for _, name in batch]
+            if self.dry_run:
+                self.reclaimed += sum(self.size(content_storage.path(name)) for name in names)
+            else:
+                self.reclaimed += delete_unreferenced(names)
+            total += len(names)
+        self.stdout.write("Unreferenced blobs: {}".format(total))
+
+    def collect_files(self, root, unreferenced):
+        """
+        Streams `root` with os.scandir and hands files older than the cutoff
+        to `unreferenced` one batch at a time, so memory use does not depend
+        on how many files there are.
+        """
+        top = default_storage.path(root)
+        media_root = default_storage.path("")
+        cutoff = self.cutoff.timestamp()
+        total = 0
+        batch = []
+
+        def flush():
+            nonlocal total
+            for path, size in unreferenced(batch):
+                if not self.dry_run:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                self.reclaimed += size
+                total += 1
+            batch.clear()
+
+        for directory, entry in self.walk(top):
+            if entry is None:
+                # Everything below was handled, drop the directory if it is empty
+                flush()
+                if directory != top and not self.dry_run:
+                    try:
+                        os.rmdir(directory)
+                    except OSError:
+                        pass
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime < cutoff:
+                name = os.path.relpath(entry.path, media_root).replace(os.sep, "/")
+                batch.append((name, entry.path, stat.st_size))
+                if len(batch) >= self.batch_size:
+                    flush()
+        flush()
+        self.stdout.write("Stray files under {}/: {}".format(root, total))
+
+    def walk(self, top):
+        """
+        Yields (directory, entry) for every file below `top`, then
+        (directory, None) once a directory and its subdirectories are done.
+        Only directory paths are kept in memory while scanning.
+        """
+        if not os.path.isdir(top):
+            return
+        stack = [(top, False)]
+        while stack:
+            directory, scanned = stack.pop()
+            if scanned:
+                yield directory, None
+                continue
+            stack.append((directory, True))
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, False))
+                    elif entry.is_file(follow_symlinks=False):
+                        yield directory, entry
+
+    def unreferenced_temp_files(self, batch):
+        # Blob rows count references from TempFile, ProjectFile and ProjectPhoto,
+        # including files stored here before blob storage existed
+        names = [name for name, _, _ in batch]
+        referenced = set(Blob.objects.filter(name__in=names).values_list("name", flat=True))
+        referenced.update(ChunkedUpload.objects.filter(file__in=names).values_list("file", flat=True))
+        return [(path, size) for name, path, size in batch if name not in referenced]
+
+    def unreferenced_blob_files(self, batch):
+        # A blob file is kept when a Blob row has the same hash, this covers
+        # its variants too. Rows are looked up per shard directory. Files
+        # left by interrupted saves never have a row.
+        directories = {
+            os.path.dirname(name) + "/" for name, _, _ in batch
+            if not os.path.basename(name).startswith(".partial-")
+        }
+        known = set()
+        for directory in directories:
+            for name in Blob.objects.filter(name__startswith=directory).values_list("name", flat=True):
+                known.add(os.path.basename(name).split(".")[0])
+        return [
+            (path, size) for name, path, size in batch
+            if os.path.basename(name).startswith(".partial-") or os.path.basename(name).split(".")[0] not in known
+        ]
+
+    def size(self, path):
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return 0
@@ -0,0 +1,35 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from api.services import OtpDispatcher
+
+
+class Command(BaseCommand):
+    help = "Delivers pending OTP messages from the outbox through the SMS backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Number of dispatch threads")
+        parser.add_argument("--batch-size", type=int, default=None, help="Outbox rows claimed per gateway round")
+        parser.add_argument("--once", action="store_true", help="Drain the outbox once and exit")
+
+    def handle(self, *args, **options):
+        dispatcher = OtpDispatcher(workers=options["workers"], batch_size=options["batch_size"])
+
+        if options["once"]:
+            total = 0
+            while True:
+                sent = dispatcher.dispatch_once()
+                if not sent:
+                    break
+                total += sent
+            self.stdout.write("Processed {} outbox rows".format(total))
+            return
+
+        signal.signal(signal.SIGTERM, lambda *_: dispatcher.stop())
+        dispatcher.start()
+        self.stdout.write("Dispatching OTPs with {} workers".format(dispatcher.workers))
+        try:
+            dispatcher.join()
+        except KeyboardInterrupt:
+            dispatcher.stop()
@@ -0,0 +1,40 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.exports import FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = "Streams all projects or clients, with their details, as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["projects", "clients"])
+        parser.add_argument("--output", choices=list(FORMATS), default="ndjson")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output on the fly")
+        parser.add_argument("--file", help="Write to this file instead of stdout")
+        parser.add_argument("--chunk-size", type=int, help="Rows read and written at once, EXPORT_CHUNK_SIZE by default")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        pieces = export_stream(options["kind"], options["output"], options["gzip"], chunk_size=options["chunk_size"])
+        if options["file"]:
+            destination = open(options["file"], "wb")
+        else:
+            destination = sys.stdout.buffer
+        written = 0
+        try:
+            for piece in pieces:
+                data = piece if isinstance(piece, bytes) else piece.encode()
+                destination.write(data)
+                written += len(data)
+        finally:
+            if options["file"]:
+                destination.close()
+            else:
+                destination.flush()
+        if options["file"]:
+            self.stdout.write("Wrote {:.1f} MiB to {} in {:.1f}s".format(
+                written / 2 ** 20, options["file"], time.monotonic() - started
+            ))
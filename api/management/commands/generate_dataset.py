@@ -0,0 +1,242 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from taggit.models import Tag
+
+from api.constants import INDIVIDUAL, LEGAL_ENTITY, WORKER_TYPE
+from api.models import Client, FreelancerCategory, Individual, LegalEntity, Project, ProjectCategory, User
+from api.search import get_project_search
+from api.trees import invalidate_tree
+
+
+PHONE_PREFIX = "99870"
+PASSWORD = "dataset-password"
+
+WORDS = {
+    "uz": [
+        "ilova", "sayt", "dizayn", "logotip", "mobil", "dastur", "tarjima", "maqola", "video", "montaj",
+        "marketing", "reklama", "hisobot", "buxgalteriya", "server", "baza", "android", "telegram", "bot", "dokon",
+    ],
+    "ru": [
+        "разработка", "сайт", "дизайн", "логотип", "приложение", "перевод", "статья", "видео", "монтаж", "реклама",
+        "бухгалтерия", "сервер", "магазин", "бот", "интеграция", "верстка", "тестирование", "поддержка", "анализ",
+    ],
+}
+CITIES = ["Tashkent", "Samarkand", "Bukhara", "Namangan", "Andijan", "Fergana", "Nukus", "Karshi"]
+STATUSES = [status for status, _ in Project.STATUS]
+WORKER_TYPES = [worker_type for worker_type, _ in WORKER_TYPE]
+
+
+def bulk_insert(model, objects):
+    """
+    bulk_create that leaves the primary keys set. SQLite does not return
+    them before Django 4.0, there rows inserted in one transaction get
+    consecutive ids, so they are derived from the highest one.
+    """
+    with transaction.atomic():
+        model.objects.bulk_create(objects)
+        if objects and objects[0].pk is None:
+            last = model.objects.order_by("-pk").values_list("pk", flat=True).first()
+            for offset, instance in enumerate(objects):
+                instance.pk = last - len(objects) + 1 + offset
+    return objects
+
+
+def next_number(values, prefix):
+    """
+    One more than the highest number following `prefix` in `values`, 0 if
+    there is none. Counting the rows instead would hand out a number that
+    is still taken once any earlier row has been deleted.
+    """
+    numbers = [value[len(prefix):].split("-", 1)[0] for value in values]
+    numbers = [int(number) for number in numbers if number.isdigit()]
+    return max(numbers, default=-1) + 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with a deterministic synthetic dataset for scale testing. "
+        "The project search triggers are paused while projects are inserted, the new rows are indexed once at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000, help="Users, each with a client and its details")
+        parser.add_argument("--projects", type=int, default=100000)
+        parser.add_argument("--roots", type=int, default=10, help="Root categories of each category tree")
+        parser.add_argument("--depth", type=int, default=3, help="Levels below every root")
+        parser.add_argument("--branching", type=int, default=4, help="Children of every non-leaf category")
+        parser.add_argument("--tags", type=int, default=500, help="Distinct tags")
+        parser.add_argument("--tags-per-project", type=int, default=3)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        started = time.monotonic()
+        if connection.vendor == "sqlite":
+            # A crash leaves a half generated dataset either way, so skip fsyncs
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA synchronous = OFF")
+
+        client_ids = self.generate_clients(options["users"])
+        leaves = {
+            model: self.generate_tree(model, options["roots"], options["depth"], options["branching"])
+            for model in (ProjectCategory, FreelancerCategory)
+        }
+        tag_ids = self.generate_tags(options["tags"])
+
+        # Only the index triggers are paused, search keeps serving the rows
+        # already indexed and just the new ones are indexed afterwards
+        search = get_project_search()
+        last_id = Project.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        search.disable_sync()
+        try:
+            self.generate_projects(options["projects"], client_ids, leaves, tag_ids, options["tags_per_project"])
+        finally:
+            step = time.monotonic()
+            search.enable_sync(last_id)
+            self.stdout.write("New projects indexed for search in {:.1f}s".format(time.monotonic() - step))
+
+        self.stdout.write("Done in {:.1f}s".format(time.monotonic() - started))
+
+    def progress(self, label, done, total, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write("{} {}/{} ({:.0f} rows/s)".format(label, done, total, done / elapsed if elapsed else 0))
+        self.stdout.flush()
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def generate_clients(self, total):
+        # Hashing is the slow part of creating a user, every user shares one hash
+        password = make_password(PASSWORD)
+        started = time.monotonic()
+        first = next_number(
+            User.objects.filter(phone__startswith=PHONE_PREFIX).values_list("phone", flat=True).iterator(), PHONE_PREFIX
+        )
+        client_ids = []
+        for start, size in self.batches(total):
+            users = bulk_insert(User, [
+                User(phone="{}{:07d}".format(PHONE_PREFIX, first + start + i), password=password, is_staff=False,
+                     is_admin=False)
+                for i in range(size)
+            ])
+            clients = bulk_insert(Client, [
+                Client(user_id=user.pk, fullname=self.name(), client_type=self.random.choice([INDIVIDUAL, LEGAL_ENTITY]))
+                for user in users
+            ])
+            Individual.objects.bulk_create([
+                self.individual(client) for client in clients if client.client_type == INDIVIDUAL
+            ])
+            LegalEntity.objects.bulk_create([
+                self.legal_entity(client) for client in clients if client.client_type == LEGAL_ENTITY
+            ])
+            client_ids.extend(client.pk for client in clients)
+            self.progress("clients", start + size, total, started)
+        return client_ids
+
+    def name(self):
+        first = self.random.choice(["Aziz", "Dilnoza", "Jasur", "Madina", "Otabek", "Nigora", "Sardor", "Zarina"])
+        last = self.random.choice(["Karimov", "Rahimova", "Yusupov", "Aliyeva", "Tursunov", "Saidova"])
+        return "{} {}".format(first, last)
+
+    def individual(self, client):
+        return Individual(
+            client_id=client.pk, fullname=client.fullname, passport_series="AA",
+            passport_number="{:07d}".format(self.random.randrange(10 ** 7)),
+            passport_given_date=timezone.now().date() - timezone.timedelta(days=self.random.randrange(3650)),
+            passport_issued_address="IIB", country="Uzbekistan", region=self.random.choice(CITIES),
+            city=self.random.choice(CITIES), address="Street {}".format(self.random.randrange(1, 200)),
+        )
+
+    def legal_entity(self, client):
+        return LegalEntity(
+            client_id=client.pk, fullname=client.fullname, company="{} MChJ".format(self.random.choice(WORDS["uz"])),
+            bank_name="Bank", bank_account="{:020d}".format(self.random.randrange(10 ** 20)),
+            mfo="{:05d}".format(self.random.randrange(10 ** 5)), inn="{:09d}".format(self.random.randrange(10 ** 9)),
+            country="Uzbekistan", region=self.random.choice(CITIES), city=self.random.choice(CITIES),
+            post_code="{:06d}".format(self.random.randrange(10 ** 6)), address="Street 1",
+            telegram_phone="99890{:07d}".format(self.random.randrange(10 ** 7)), email="info@example.com",
+        )
+
+    def generate_tree(self, model, roots, depth, branching):
+        """
+        Inserts the categories level by level with placeholder tree fields
+        and lets django-mptt compute them once at the end. Returns the ids of
+        the leaves, projects are filed under those.
+        """
+        started = time.monotonic()
+        # Every run gets its own slug prefix, all its slugs are "<model>-<run>-..."
+        run = "{}-".format(model._meta.model_name)
+        slugs = model.objects.filter(slug__startswith=run).values_list("slug", flat=True).iterator()
+        prefix = "{}{}".format(run, next_number(slugs, run))
+        level = bulk_insert(model, [
+            model(slug="{}-{}".format(prefix, i), lft=0, rght=0, tree_id=0, level=0) for i in range(roots)
+        ])
+        nodes = list(level)
+        for _ in range(depth):
+            level = bulk_insert(model, [
+                model(slug="{}-{}".format(parent.slug, i), parent_id=parent.pk, lft=0, rght=0, tree_id=0, level=0)
+                for parent in level
+                for i in range(branching)
+            ])
+            nodes.extend(level)
+        translation_model = model._parler_meta.root_model
+        for start, size in self.batches(len(nodes)):
+            translation_model.objects.bulk_create([
+                translation_model(
+                    master_id=node.pk, language_code=language,
+                    title=" ".join(self.random.sample(WORDS[language], 2)).capitalize(),
+                )
+                for node in nodes[start:start + size]
+                for language in WORDS
+            ])
+        model.objects.rebuild()
+        invalidate_tree(model)
+        self.stdout.write("{}: {} nodes in {:.1f}s".format(model.__name__, len(nodes), time.monotonic() - started))
+        return [node.pk for node in level]
+
+    def generate_tags(self, total):
+        existing = set(Tag.objects.filter(slug__startswith="dataset-").values_list("slug", flat=True))
+        tags = [
+            Tag(name="dataset {}".format(i), slug="dataset-{}".format(i))
+            for i in range(total) if "dataset-{}".format(i) not in existing
+        ]
+        Tag.objects.bulk_create(tags)
+        return list(Tag.objects.filter(slug__startswith="dataset-").values_list("pk", flat=True))
+
+    def generate_projects(self, total, client_ids, leaves, tag_ids, tags_per_project):
+        content_type = ContentType.objects.get_for_model(Project)
+        through = Project.tags.through
+        today = timezone.now().date()
+        started = time.monotonic()
+        for start, size in self.batches(total):
+            projects = []
+            for _ in range(size):
+                language = self.random.choice(list(WORDS))
+                words = WORDS[language]
+                projects.append(Project(
+                    client_id=self.random.choice(client_ids) if client_ids else None,
+                    title=" ".join(self.random.choices(words, k=4)).capitalize(),
+                    description=" ".join(self.random.choices(words, k=40)),
+                    project_category_id=self.random.choice(leaves[ProjectCategory]),
+                    freelancer_category_id=self.random.choice(leaves[FreelancerCategory]),
+                    worker_type=self.random.choice(WORKER_TYPES),
+                    price=self.random.randrange(10, 10000) * 1000,
+                    deadline=today + timezone.timedelta(days=self.random.randrange(365)),
+                    status=self.random.choice(STATUSES),
+                ))
+            bulk_insert(Project, projects)
+            through.objects.bulk_create([
+                through(tag_id=tag_id, content_type_id=content_type.pk, object_id=project.pk)
+                for project in projects
+                for tag_id in self.random.sample(tag_ids, min(tags_per_project, len(tag_ids)))
+            ])
+            self.progress("projects", start + size, total, started)
@@ -0,0 +1,43 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+
+from api.models import ProjectPhoto
+from api.variants import variant_pool
+
+
+class Command(BaseCommand):
+    help = "Renders missing variants of existing project photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-pending", type=int, default=8, help="Variants queued at once")
+        parser.add_argument("--force", action="store_true", help="Render variants that already exist again")
+
+    def handle(self, *args, **options):
+        names = ProjectPhoto.objects.exclude(photo="").order_by().values_list("photo", flat=True).distinct()
+        started = time.monotonic()
+        pending = set()
+        rendered = failed = 0
+
+        def collect(done):
+            nonlocal rendered, failed
+            for future in done:
+                if future.exception() is None:
+                    rendered += 1
+                else:
+                    failed += 1
+                    self.stderr.write("  {}".format(future.exception()))
+
+        for name in names.iterator():
+            for future in variant_pool.submit_all(name, force=options["force"]):
+                pending.add(future)
+                # Queue no further than the pool can drain, however many photos there are
+                while len(pending) >= options["max_pending"]:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+        done, _ = wait(pending)
+        collect(done)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write("Rendered {} variants, {} failed, in {:.1f}s".format(rendered, failed, elapsed))
@@ -0,0 +1,337 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client as TestClient
+from django.utils import timezone
+
+from api.models import FreelancerCategory, Otp, OtpOutbox, Project, ProjectCategory, TempFile, User
+from api.services import otp_dispatcher
+from api.sms import StubSmsBackend
+
+
+PHONE_PREFIX = "99801"
+PASSWORD = "loadtest-password"
+STEPS = ["otp", "validate", "client", "individual", "token", "temp_file", "project"]
+# Upper bounds of the latency histogram buckets in milliseconds
+BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class InProcessTransport:
+    """
+    Calls the views through the Django test client, one client per thread.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, data=None, files=None, headers=None, address=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = TestClient(raise_request_exception=False)
+        extra = {"HTTP_" + name.upper().replace("-", "_"): value for name, value in (headers or {}).items()}
+        if address:
+            extra["REMOTE_ADDR"] = address
+        if files:
+            data = dict(data or {})
+            for field, (filename, content) in files.items():
+                data[field] = SimpleUploadedFile(filename, content)
+            response = client.post(path, data, **extra)
+        else:
+            response = client.generic(method, path, json.dumps(data or {}), "application/json", **extra)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    """
+    Calls a running server over HTTP with the standard library only.
+    """
+
+    def __init__(self, url, timeout):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, data=None, files=None, headers=None, address=None):
+        headers = dict(headers or {})
+        if address:
+            # Only honoured by a server that trusts one proxy hop (NUM_PROXIES)
+            headers["X-Forwarded-For"] = address
+        if files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for field, value in (data or {}).items():
+                parts.append('--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(
+                    boundary, field, value
+                ).encode())
+            for field, (filename, content) in files.items():
+                parts.append('--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                             'Content-Type: application/octet-stream\r\n\r\n'.format(boundary, field, filename).encode())
+                parts.append(content + b"\r\n")
+            parts.append("--{}--\r\n".format(boundary).encode())
+            body = b"".join(parts)
+            headers["Content-Type"] = "multipart/form-data; boundary={}".format(boundary)
+        else:
+            body = json.dumps(data or {}).encode()
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(self.url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status_code, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status_code, payload = e.code, e.read()
+        except OSError:
+            return 0, None
+        try:
+            return status_code, json.loads(payload)
+        except ValueError:
+            return status_code, None
+
+    def close(self):
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives the signup and project funnel (otp, validate, client, individual, token, temp-file, project) "
+        "with concurrent virtual users and reports per-step latency, throughput and errors. "
+        "With --url the server must use the same database, OTP codes are read from the SMS outbox, "
+        "and it needs NUM_PROXIES=1 or higher throttle rates since every user comes from this host."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100, help="Number of journeys to run")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--url", help="Base URL of a running server, the views are called in-process by default")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for one HTTP response")
+        parser.add_argument("--sms-latency", type=float, default=0, help="Seconds the in-process SMS stub takes")
+        parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline")
+        parser.add_argument("--compare", metavar="PATH", help="Compare the results with a saved baseline")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Allowed relative slowdown of p50/p90 before a step counts as regressed")
+        parser.add_argument("--keep", action="store_true", help="Keep the created users and projects")
+
+    def handle(self, *args, **options):
+        self.transport = HttpTransport(options["url"], options["timeout"]) if options["url"] else InProcessTransport()
+        self.project_category, self.freelancer_category = self.categories()
+        self.phones = self.free_phones(options["users"])
+        self.created = {step: [] for step in ("otp", "client", "temp_file", "project")}
+        self.started = timezone.now()
+
+        backend = otp_dispatcher._backend
+        if not options["url"]:
+            # Codes are never sent anywhere, the journey reads them from the outbox
+            otp_dispatcher._backend = StubSmsBackend(latency=options["sms_latency"])
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                journeys = list(executor.map(self.journey, range(options["users"])))
+            wall = time.perf_counter() - started
+        finally:
+            otp_dispatcher._backend = backend
+            StubSmsBackend.outbox.clear()
+            if not options["keep"]:
+                self.cleanup()
+
+        results = self.summarize(journeys, wall, options)
+        self.report(results)
+        if options["save"]:
+            with open(options["save"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write("Baseline written to {}".format(options["save"]))
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+            regressed = self.compare(baseline, results, options["tolerance"])
+            if regressed:
+                raise CommandError("Regressed steps: {}".format(", ".join(regressed)))
+
+    def categories(self):
+        project_category = ProjectCategory.objects.order_by("id").first()
+        freelancer_category = FreelancerCategory.objects.order_by("id").first()
+        if project_category is None or freelancer_category is None:
+            raise CommandError("Create at least one project and one freelancer category first")
+        return project_category.id, freelancer_category.id
+
+    def free_phones(self, count):
+        taken = set(User.objects.filter(phone__startswith=PHONE_PREFIX).values_list("phone", flat=True))
+        phones = []
+        number = 0
+        while len(phones) < count:
+            phone = "{}{:07d}".format(PHONE_PREFIX, number)
+            if phone not in taken:
+                phones.append(phone)
+            number += 1
+        return phones
+
+    def cleanup(self):
+        """
+        Deletes only the rows the journeys created, by the ids the API returned.
+        """
+        # Projects keep a null client when the client goes, delete them first
+        Project.objects.filter(id__in=self.created["project"]).delete()
+        TempFile.objects.filter(id__in=self.created["temp_file"]).delete()
+        User.objects.filter(client__id__in=self.created["client"]).delete()
+        Otp.objects.filter(id__in=self.created["otp"]).delete()
+        OtpOutbox.objects.filter(phone__in=self.phones, created_at__gte=self.started).delete()
+
+    def journey(self, number):
+        """
+        Runs the funnel for one new user and returns (step, milliseconds,
+        ok) for every step attempted. The journey stops at the first failure.
+        """
+        phone = self.phones[number]
+        # Each virtual user looks like its own client to the IP throttles
+        address = "10.{}.{}.{}".format(number >> 16 & 255, number >> 8 & 255, number & 255)
+        state = {}
+        timings = []
+        try:
+            for step in STEPS:
+                method, path, data, files, extra = getattr(self, "step_" + step)(phone, state)
+                started = time.perf_counter()
+                status_code, payload = self.transport.request(method, path, data, files, extra, address)
+                elapsed = (time.perf_counter() - started) * 1000
+                ok = 200 <= status_code < 300 and not (isinstance(payload, dict) and payload.get("status") is False)
+                timings.append((step, elapsed, ok))
+                if not ok:
+                    break
+                state[step] = payload
+                if step in self.created:
+                    self.created[step].append(payload["id"])
+        finally:
+            self.transport.close()
+        return timings
+
+    def step_otp(self, phone, state):
+        return "POST", "/api/otp/", {"phone": phone}, None, {}
+
+    def step_validate(self, phone, state):
+        code = OtpOutbox.objects.filter(phone=phone).order_by("-id").values_list("code", flat=True).first()
+        return "POST", "/api/otp/{}/validate/".format(state["otp"]["id"]), {"code": code}, None, {}
+
+    def step_client(self, phone, state):
+        return "POST", "/api/client/", {"fullname": "Load Test", "user": {"phone": phone, "password": PASSWORD}}, None, {}
+
+    def step_individual(self, phone, state):
+        return "POST", "/api/individual/", {
+            "client": state["client"]["id"], "fullname": "Load Test", "passport_series": "AA",
+            "passport_number": "1234567", "passport_given_date": "2020-01-01", "passport_issued_address": "Tashkent",
+            "country": "Uzbekistan", "region": "Tashkent", "city": "Tashkent", "address": "Street 1",
+        }, None, {}
+
+    def step_token(self, phone, state):
+        return "POST", "/api/token/", {"phone": phone, "password": PASSWORD}, None, {}
+
+    def step_temp_file(self, phone, state):
+        return "POST", "/api/temp-file/", {}, {"file": ("brief.txt", "Brief for {}\n".format(phone).encode())}, {}
+
+    def step_project(self, phone, state):
+        return "POST", "/api/project/", {
+            "title": "Load test project", "description": "Landing page for {}".format(phone),
+            "worker_type": "freelancer", "project_category": self.project_category,
+            "freelancer_category": self.freelancer_category, "price": 100, "deadline": "2030-01-01",
+            "status": "published", "files": [state["temp_file"]["id"]],
+        }, None, {"Authorization": "Bearer {}".format(state["token"]["access"])}
+
+    def summarize(self, journeys, wall, options):
+        steps = {}
+        for step in STEPS:
+            timings = [(elapsed, ok) for journey in journeys for name, elapsed, ok in journey if name == step]
+            passed = [elapsed for elapsed, ok in timings if ok]
+            histogram = [0] * len(BUCKETS)
+            for elapsed in passed:
+                histogram[next(i for i, bound in enumerate(BUCKETS) if elapsed <= bound)] += 1
+            steps[step] = {
+                "requests": len(timings),
+                "errors": len(timings) - len(passed),
+                "error_rate": (len(timings) - len(passed)) / len(timings) if timings else 0,
+                "p50": percentile(passed, 0.5) if passed else None,
+                "p90": percentile(passed, 0.9) if passed else None,
+                "p99": percentile(passed, 0.99) if passed else None,
+                "max": max(passed) if passed else None,
+                "histogram": histogram,
+            }
+        completed = sum(1 for journey in journeys if len(journey) == len(STEPS) and journey[-1][2])
+        return {
+            "mode": options["url"] or "in-process",
+            "users": options["users"],
+            "concurrency": options["concurrency"],
+            "seconds": wall,
+            "completed": completed,
+            "journeys_per_second": completed / wall,
+            "requests_per_second": sum(len(journey) for journey in journeys) / wall,
+            "steps": steps,
+        }
+
+    def report(self, results):
+        self.stdout.write("{} journeys, concurrency {}, {}: {} completed in {:.1f}s".format(
+            results["users"], results["concurrency"], results["mode"], results["completed"], results["seconds"]
+        ))
+        self.stdout.write("{:.1f} journeys/s, {:.1f} requests/s".format(
+            results["journeys_per_second"], results["requests_per_second"]
+        ))
+        self.stdout.write("{:<11}{:>9}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+            "step", "requests", "errors", "p50 ms", "p90 ms", "p99 ms", "max ms"
+        ))
+        for step, data in results["steps"].items():
+            self.stdout.write("{:<11}{:>9}{:>7.1%}{:>10}{:>10}{:>10}{:>10}".format(
+                step, data["requests"], data["error_rate"],
+                *("{:.1f}".format(data[key]) if data[key] is not None else "-" for key in ("p50", "p90", "p99", "max"))
+            ))
+        self.stdout.write("\nLatency histogram (ms, upper bounds)")
+        self.stdout.write("{:<11}".format("step") + "".join(
+            "{:>7}".format("<=" + str(bound) if bound != float("inf") else ">" + str(BUCKETS[-2])) for bound in BUCKETS
+        ))
+        for step, data in results["steps"].items():
+            self.stdout.write("{:<11}".format(step) + "".join("{:>7}".format(count) for count in data["histogram"]))
+
+    def compare(self, baseline, results, tolerance):
+        """
+        Prints the change of every step against the baseline and returns the
+        steps that got slower than the tolerance allows or started failing.
+        """
+        regressed = []
+        self.stdout.write("\nAgainst baseline ({} users, concurrency {}, {})".format(
+            baseline["users"], baseline["concurrency"], baseline["mode"]
+        ))
+        self.stdout.write("{:<11}{:>10}{:>10}{:>12}".format("step", "p50", "p90", "errors"))
+        for step, data in results["steps"].items():
+            before = baseline["steps"].get(step)
+            if before is None:
+                continue
+            changes = []
+            slower = False
+            for key in ("p50", "p90"):
+                if data[key] is None or not before[key]:
+                    changes.append("-")
+                    continue
+                change = data[key] / before[key] - 1
+                slower = slower or change > tolerance
+                changes.append("{:+.0%}".format(change))
+            failing = data["error_rate"] > before["error_rate"]
+            if slower or failing:
+                regressed.append(step)
+            self.stdout.write("{:<11}{:>10}{:>10}{:>6.1%}->{:.1%}{}".format(
+                step, *changes, before["error_rate"], data["error_rate"], "  REGRESSED" if slower or failing else ""
+            ))
+        self.stdout.write("Throughput {:.1f} -> {:.1f} journeys/s".format(
+            baseline["journeys_per_second"], results["journeys_per_second"]
+        ))
+        return regressed
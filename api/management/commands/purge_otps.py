@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from api.models import Otp, OtpOutbox, RevokedToken
+
+
+class Command(BaseCommand):
+    help = "Deletes expired or activated OTPs, delivered outbox rows and expired token revocations in primary key batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Primary key range deleted per statement")
+        parser.add_argument("--grace", type=int, default=0, help="Keep OTPs for this many minutes after they expire")
+        parser.add_argument("--outbox-retention", type=int, default=24, help="Keep delivered outbox rows for this many hours")
+        parser.add_argument("--sleep", type=float, default=0, help="Pause between batches, in seconds")
+        parser.add_argument("--dry-run", action="store_true", help="Count matching rows without deleting them")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cutoff = now - timezone.timedelta(minutes=options["grace"])
+        self.purge(
+            Otp,
+            Q(expires_in__lt=cutoff) | Q(activated=True, updated_at__lt=cutoff),
+            options,
+        )
+        self.purge(
+            OtpOutbox,
+            Q(status__in=[OtpOutbox.SENT, OtpOutbox.FAILED])
+            & Q(updated_at__lt=now - timezone.timedelta(hours=options["outbox_retention"])),
+            options,
+        )
+        self.purge(RevokedToken, Q(expires_at__lt=cutoff), options)
+
+    def purge(self, model, condition, options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+        name = model.__name__
+
+        bounds = model.objects.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is None:
+            self.stdout.write("No {} rows to purge".format(name))
+            return
+
+        started = time.monotonic()
+        total = 0
+        low = bounds["low"]
+        while low <= bounds["high"]:
+            batch = model.objects.filter(condition, pk__gte=low, pk__lt=low + batch_size)
+            if dry_run:
+                total += batch.count()
+            else:
+                total += batch.delete()[0]
+            low += batch_size
+            if options["verbosity"] > 1:
+                self.stdout.write("  {} up to pk {}: {} rows".format(name, low - 1, total))
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            "{} {} {} rows in {:.2f}s ({:.0f} rows/s)".format(
+                "Would delete" if dry_run else "Deleted",
+                total,
+                name,
+                elapsed,
+                total / elapsed if elapsed else 0,
+            )
+        )
@@ -0,0 +1,89 @@
+import glob
+import io
+import json
+import os
+import pstats
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.profiling import PROFILE_HEADER, profile_token, route_directory
+
+
+def normalize_sql(sql):
+    # Queries that differ only in the length of an IN list are the same query
+    sql = re.sub(r"\s+", " ", sql).strip()
+    return re.sub(r"IN \((%s, )*%s\)", "IN (...)", sql)
+
+
+class Command(BaseCommand):
+    help = "Summarizes the hottest functions and queries of the captured request profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--route", help="Only profiles of this route, e.g. project-list")
+        parser.add_argument("--limit", type=int, default=25, help="Functions and queries to list")
+        parser.add_argument("--sort", choices=["cumulative", "tottime", "ncalls"], default="cumulative")
+        parser.add_argument("--match", help="Only functions whose file:line(name) matches this regex, "
+                                            "e.g. ProjectCreateUpdateViewSet|ClientGetSerializer")
+        parser.add_argument("--token", action="store_true", help="Print a signed X-Profile header and exit")
+
+    def handle(self, *args, **options):
+        if options["token"]:
+            self.stdout.write("{}: {}".format(PROFILE_HEADER, profile_token()))
+            return
+
+        root = route_directory(options["route"]) if options["route"] else os.path.join(settings.PROFILE_DIR, "*")
+        captures = sorted(glob.glob(os.path.join(root, "*", "meta.json")))
+        if not captures:
+            raise CommandError("No profiles under {}".format(settings.PROFILE_DIR))
+
+        routes = defaultdict(list)
+        queries = defaultdict(lambda: {"count": 0, "duration": 0.0, "routes": set()})
+        profiles = []
+        for path in captures:
+            directory = os.path.dirname(path)
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+                with open(os.path.join(directory, "queries.json")) as f:
+                    captured = json.load(f)
+            except (OSError, ValueError):
+                continue
+            routes[meta["route"]].append(meta)
+            profiles.append(os.path.join(directory, "profile.prof"))
+            for query in captured:
+                entry = queries[normalize_sql(query["sql"])]
+                entry["count"] += 1
+                entry["duration"] += query["duration"]
+                entry["routes"].add(meta["route"])
+
+        self.stdout.write("{:<32}{:>9}{:>12}{:>12}{:>10}".format("route", "profiles", "mean ms", "db ms", "queries"))
+        for route, metas in sorted(routes.items()):
+            self.stdout.write("{:<32}{:>9}{:>12.1f}{:>12.1f}{:>10.1f}".format(
+                route, len(metas),
+                sum(meta["duration"] for meta in metas) / len(metas) * 1000,
+                sum(meta["db_duration"] for meta in metas) / len(metas) * 1000,
+                sum(meta["queries"] for meta in metas) / len(metas),
+            ))
+
+        self.stdout.write("\nHot functions")
+        # pstats writes partial lines, which OutputWrapper would end one by one
+        buffer = io.StringIO()
+        stats = pstats.Stats(*profiles, stream=buffer)
+        # The header would list every profile file
+        stats.files = []
+        stats.sort_stats(options["sort"])
+        restrictions = [options["match"]] if options["match"] else []
+        stats.print_stats(*restrictions, options["limit"])
+        self.stdout.write(buffer.getvalue())
+
+        self.stdout.write("Hot queries by total time")
+        self.stdout.write("{:>7}{:>11}{:>10}  {}".format("calls", "total ms", "mean ms", "query"))
+        ranked = sorted(queries.items(), key=lambda item: item[1]["duration"], reverse=True)
+        for sql, entry in ranked[:options["limit"]]:
+            self.stdout.write("{:>7}{:>11.1f}{:>10.2f}  {}".format(
+                entry["count"], entry["duration"] * 1000, entry["duration"] / entry["count"] * 1000, sql[:300]
+            ))
+            self.stdout.write("{:>30}{}".format("routes: ", ", ".join(sorted(entry["routes"]))))
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import UserManager as BaseUserManager
+from django.db import models
 from django.utils.translation import gettext as _
 
 from parler.managers import TranslatableManager, TranslatableQuerySet
@@ -28,6 +29,12 @@ class UserManager(BaseUserManager):
         return user
 
 
+class ClientQuerySet(models.QuerySet):
+
+    def with_details(self):
+        return self.select_related("user", "individual", "legal_entity")
+
+
 class CategoryQuerySet(TranslatableQuerySet, TreeQuerySet):
 
     def as_manager(cls):
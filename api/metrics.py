@@ -0,0 +1,145 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+
+
+# Upper bounds of the histogram buckets, the last bucket is +Inf
+HISTOGRAMS = {
+    "request_duration_seconds": (
+        "Wall time of the request",
+        [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    ),
+    "db_duration_seconds": (
+        "Time spent in database queries",
+        [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+    ),
+    "db_queries": (
+        "Database queries per request",
+        [0, 1, 2, 3, 5, 10, 20, 50, 100, 200],
+    ),
+    "response_size_bytes": (
+        "Size of the response body",
+        [100, 1000, 10000, 100000, 1000000, 10000000],
+    ),
+}
+PREFIX = "twork_"
+
+
+class MetricsStore:
+    """
+    Per-process histograms keyed by route and method. Every process writes
+    its counters to its own file in METRICS_DIR at most once per
+    METRICS_FLUSH_INTERVAL, and the /metrics view adds up all the files, so
+    the numbers cover every worker of the host.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._flushed_at = time.monotonic()
+        self._path = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            # The pid alone could be reused by a later worker
+            self._path = os.path.join(settings.METRICS_DIR, "{}-{}.json".format(os.getpid(), uuid.uuid4().hex[:8]))
+        return self._path
+
+    def observe(self, route, method, values):
+        """
+        Records one request, `values` maps histogram names to observations.
+        """
+        key = (route, method)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    name: [[0] * (len(bounds) + 1), 0] for name, (_, bounds) in HISTOGRAMS.items()
+                }
+            for name, value in values.items():
+                histogram = series[name]
+                histogram[0][bisect_left(HISTOGRAMS[name][1], value)] += 1
+                histogram[1] += value
+            due = time.monotonic() - self._flushed_at >= settings.METRICS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "{}|{}".format(*key): {name: [list(counts), total] for name, (counts, total) in series.items()}
+                for key, series in self._series.items()
+            }
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        descriptor, partial = tempfile.mkstemp(dir=settings.METRICS_DIR, prefix=".partial-")
+        with os.fdopen(descriptor, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(partial, self.path)
+
+    def collect(self):
+        """
+        Adds up the snapshots of all processes. Files of processes that
+        stopped writing longer than METRICS_RETENTION ago are removed.
+        """
+        self.flush()
+        totals = {}
+        cutoff = time.time() - settings.METRICS_RETENTION
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for key, series in snapshot.items():
+                target = totals.setdefault(key, {})
+                for name, (counts, total) in series.items():
+                    if name not in target:
+                        target[name] = [list(counts), total]
+                        continue
+                    target[name][1] += total
+                    for i, count in enumerate(counts):
+                        target[name][0][i] += count
+        return totals
+
+    def render(self):
+        """
+        Prometheus text exposition of the collected histograms.
+        """
+        totals = self.collect()
+        lines = [
+            "# HELP {0}metrics_sample_rate Fraction of requests that are measured".format(PREFIX),
+            "# TYPE {0}metrics_sample_rate gauge".format(PREFIX),
+            "{}metrics_sample_rate {}".format(PREFIX, settings.METRICS_SAMPLE_RATE),
+        ]
+        for name, (description, bounds) in HISTOGRAMS.items():
+            metric = PREFIX + name
+            lines.append("# HELP {} {}".format(metric, description))
+            lines.append("# TYPE {} histogram".format(metric))
+            for key in sorted(totals):
+                route, method = key.split("|", 1)
+                labels = 'route="{}",method="{}"'.format(route, method)
+                counts, total = totals[key][name]
+                cumulative = 0
+                for bound, count in zip(bounds + ["+Inf"], counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels, bound, cumulative))
+                lines.append("{}_sum{{{}}} {}".format(metric, labels, total))
+                lines.append("{}_count{{{}}} {}".format(metric, labels, cumulative))
+        return "\n".join(lines) + "\n"
+
+
+metrics_store = MetricsStore()
@@ -0,0 +1,123 @@
+import cProfile
+import logging
+import random
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection
+
+from api.metrics import metrics_store
+from api.profiling import QueryRecorder, is_profile_requested, save_capture
+
+
+logger = logging.getLogger(__name__)
+
+
+def route_name(request):
+    match = request.resolver_match
+    return (match.url_name or match.view_name) if match else "unresolved"
+
+
+class QueryTimer:
+    """
+    execute_wrapper that counts the queries of a request and adds up their
+    time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Records wall time, database time, query count and response size of a
+    sample of requests per resolved route, e.g. "project-list". Requests
+    left out of the sample only pay for one random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.METRICS_SAMPLE_RATE
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        route = route_name(request)
+        size = 0 if response.streaming else len(response.content)
+        metrics_store.observe(route, request.method, {
+            "request_duration_seconds": duration,
+            "db_duration_seconds": timer.duration,
+            "db_queries": timer.count,
+            "response_size_bytes": size,
+        })
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Runs a request under cProfile and records its SQL when it carries a
+    signed X-Profile header or falls into PROFILE_SAMPLE_RATE. The capture
+    is written under PROFILE_DIR/<route>/, see summarize_profiles.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE
+
+    def __call__(self, request):
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and not is_profile_requested(request):
+            return self.get_response(request)
+
+        profile = cProfile.Profile()
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return self.get_response(request)
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            profile.disable()
+        duration = time.perf_counter() - started
+
+        # The id becomes a directory name, keep it to safe characters
+        request_id = re.sub(r"[^\w-]", "", request.headers.get("X-Request-ID", ""))[:64] or uuid.uuid4().hex
+        route = route_name(request)
+        try:
+            save_capture(route, request_id, profile, recorder.queries, {
+                "route": route,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration": duration,
+                "queries": len(recorder.queries),
+                "db_duration": sum(query["duration"] for query in recorder.queries),
+                "sampled": sampled,
+            })
+        except OSError:
+            logger.exception("Saving a request profile failed")
+        else:
+            response["X-Profile-Id"] = request_id
+        return response
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.12 on 2026-10-18 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_otpoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['phone', 'expires_in'], name='api_otp_phone_c6f20e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['expires_in'], name='api_otp_expires_55dd19_idx'),
+        ),
+    ]
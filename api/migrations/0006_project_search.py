@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from api.search import get_project_search
+    get_project_search(schema_editor.connection).install()
+
+
+def uninstall_search_index(apps, schema_editor):
+    from api.search import get_project_search
+    get_project_search(schema_editor.connection).uninstall()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_project_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.12 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_project_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', 'worker_type', '-created_at'], name='api_project_status_a0a4a0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['project_category', 'status', '-created_at'], name='api_project_project_42f005_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['freelancer_category', 'status', '-created_at'], name='api_project_freelan_db1493_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', 'price'], name='api_project_status_89eeb3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', 'deadline'], name='api_project_status_5e529e_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_project_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='individual',
+            name='client_link',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='individual', to='api.client'),
+        ),
+        migrations.AddField(
+            model_name='legalentity',
+            name='client_link',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='legal_entity', to='api.client'),
+        ),
+    ]
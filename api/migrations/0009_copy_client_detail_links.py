@@ -0,0 +1,58 @@
+from django.db import migrations
+
+
+INDIVIDUAL = "individual"
+LEGAL_ENTITY = "legal_entity"
+
+
+def link_details(apps, schema_editor):
+    Client = apps.get_model("api", "Client")
+    models = {
+        INDIVIDUAL: apps.get_model("api", "Individual"),
+        LEGAL_ENTITY: apps.get_model("api", "LegalEntity"),
+    }
+    # Client.type_related_info is the side the API read, so it wins over
+    # the client IDs stored on the detail rows
+    linked = {INDIVIDUAL: set(), LEGAL_ENTITY: set()}
+    clients = Client.objects.filter(client_type__in=models, type_related_info__gt=0) \
+        .order_by("id").values_list("id", "client_type", "type_related_info")
+    for client_id, client_type, detail_id in clients.iterator():
+        if detail_id in linked[client_type]:
+            continue
+        models[client_type].objects.filter(id=detail_id).update(client_link=client_id)
+        linked[client_type].add(detail_id)
+    # Clients the API never pointed at a detail row are linked from the
+    # legacy client ID on the detail row, first row wins
+    for client_type, model in models.items():
+        unlinked = set(
+            Client.objects.filter(client_type=client_type).exclude(
+                id__in=model.objects.filter(client_link__isnull=False).values("client_link")
+            ).values_list("id", flat=True)
+        )
+        details = model.objects.filter(client_link__isnull=True, client__gt=0) \
+            .order_by("id").values_list("id", "client")
+        for detail_id, client_id in details.iterator():
+            if client_id not in unlinked:
+                continue
+            model.objects.filter(id=detail_id).update(client_link=client_id)
+            unlinked.discard(client_id)
+
+
+def unlink_details(apps, schema_editor):
+    Client = apps.get_model("api", "Client")
+    for client_type, model_name in ((INDIVIDUAL, "Individual"), (LEGAL_ENTITY, "LegalEntity")):
+        model = apps.get_model("api", model_name)
+        for detail in model.objects.filter(client_link__isnull=False).iterator():
+            model.objects.filter(id=detail.id).update(client=detail.client_link_id)
+            Client.objects.filter(id=detail.client_link_id, client_type=client_type).update(type_related_info=detail.id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_client_detail_links'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_details, unlink_details),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_copy_client_detail_links'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='client',
+            name='type_related_info',
+        ),
+        migrations.RemoveField(
+            model_name='individual',
+            name='client',
+        ),
+        migrations.RemoveField(
+            model_name='legalentity',
+            name='client',
+        ),
+        migrations.RenameField(
+            model_name='individual',
+            old_name='client_link',
+            new_name='client',
+        ),
+        migrations.RenameField(
+            model_name='legalentity',
+            old_name='client_link',
+            new_name='client',
+        ),
+    ]
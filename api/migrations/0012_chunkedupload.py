@@ -0,0 +1,30 @@
+# Generated by Django 3.2.12 on 2026-10-18 15:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(upload_to='files/temp/')),
+                ('filename', models.CharField(max_length=255, verbose_name='File name')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='Offset')),
+                ('sha256', models.CharField(blank=True, default='', max_length=64, verbose_name='SHA-256')),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('complete', 'Complete')], default='uploading', max_length=20, verbose_name='Status')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('temp_file', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='api.tempfile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.12 on 2026-10-18 15:05
+
+import api.storage
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    Blob = apps.get_model("api", "Blob")
+    counts = Counter()
+    for model_name, field in (("TempFile", "file"), ("ProjectFile", "file"), ("ProjectPhoto", "photo")):
+        names = apps.get_model("api", model_name).objects.exclude(**{field: ""}).values_list(field, flat=True)
+        counts.update(names.iterator())
+    Blob.objects.bulk_create(
+        [Blob(name=name, references=count) for name, count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Name')),
+                ('references', models.IntegerField(default=0, verbose_name='References')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='projectfile',
+            name='file',
+            field=models.FileField(storage=api.storage.ContentAddressedStorage(), upload_to='files/project/'),
+        ),
+        migrations.AlterField(
+            model_name='projectphoto',
+            name='photo',
+            field=models.FileField(storage=api.storage.ContentAddressedStorage(), upload_to='images/project/'),
+        ),
+        migrations.AlterField(
+            model_name='tempfile',
+            name='file',
+            field=models.FileField(storage=api.storage.ContentAddressedStorage(), upload_to='files/temp/'),
+        ),
+        migrations.AddIndex(
+            model_name='blob',
+            index=models.Index(fields=['references', 'updated_at'], name='api_blob_referen_ce3aa4_idx'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def reinstall_search_index(apps, schema_editor):
+    # The FTS5 tokenizer is fixed when the table is created, the old one stemmed English words
+    from api.search import SqliteProjectSearch
+    if schema_editor.connection.vendor == "sqlite":
+        search = SqliteProjectSearch(schema_editor.connection)
+        search.uninstall()
+        search.install()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
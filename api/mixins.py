@@ -1,30 +1,75 @@
-from django.conf import settings
-from django.utils.translation import get_language_from_request
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.translation import get_language, get_language_from_request
+from parler import appsettings
+from parler_rest.serializers import TranslatedFieldsField
+from rest_framework.decorators import action
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+from api.trees import get_tree
 
 
 class TranslatedSerializerMixin(object):
+    """
+    Replaces the nested `translations` dict with the fields of the active
+    translation. The language chain and the field list are resolved once per
+    serializer, so a list reuses them for every item.
+    """
+
+    def get_representation_plan(self):
+        plan = getattr(self, "_representation_plan", None)
+        if plan is not None:
+            return plan
+
+        request = self.context.get("request", None)
+        lang_code = get_language_from_request(request) if request else get_language()
+        languages = appsettings.PARLER_LANGUAGES.get_active_choices(lang_code)
+
+        steps = []
+        for field in self._readable_fields:
+            if isinstance(field, TranslatedFieldsField):
+                translation_serializer = field.serializer_class(context=self.context)
+                steps.append((field.source, list(translation_serializer._readable_fields)))
+            else:
+                steps.append((None, field))
+        self._representation_plan = (languages, steps)
+        return self._representation_plan
 
     def to_representation(self, instance):
-        inst_rep = super().to_representation(instance)
-        request = self.context.get("request", None) or self.request
-        lang_code = get_language_from_request(request)
+        languages, steps = self.get_representation_plan()
         result = {}
-        for field_name, field in self.get_fields().items():
-            if field_name != "translations":
-                field_value = inst_rep.pop(field_name)
-                result.update({field_name: field_value})
-            if field_name == "translations":
-                translations = inst_rep.pop(field_name)
-                if lang_code not in translations:
-                    parler_default_settings = settings.PARLER_LANGUAGES["default"]
-                    if "fallback" in parler_default_settings:
-                        lang_code = parler_default_settings.get("fallback")
-                    if "fallbacks" in parler_default_settings:
-                        lang_code = parler_default_settings.get("fallbacks")[0]
-                for lang, translation_fields in translations.items():
-                    if lang == lang_code:
-                        trans_rep = translation_fields.copy()
-                        for trans_field_name, trans_field in translation_fields.items():
-                            field_value = trans_rep.pop(trans_field_name)
-                            result.update({trans_field_name: field_value})
-        return result
\ No newline at end of file
+        for source, field in steps:
+            if source is None:
+                self._represent_field(result, field, instance)
+                continue
+            translations = {t.language_code: t for t in getattr(instance, source).all()}
+            translation = next((translations[lang] for lang in languages if lang in translations), None)
+            if translation is not None:
+                for translation_field in field:
+                    self._represent_field(result, translation_field, translation)
+        return result
+
+    def _represent_field(self, result, field, instance):
+        try:
+            attribute = field.get_attribute(instance)
+        except SkipField:
+            return
+        check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        result[field.field_name] = None if check_for_none is None else field.to_representation(attribute)
+
+
+class CategoryTreeMixin(object):
+
+    @action(detail=False, methods=["get"], url_path="tree")
+    def tree(self, request, *args, **kwargs):
+        language = get_language_from_request(request)
+        etag, body = get_tree(self.queryset.model, language)
+        if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        response["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ["Accept-Language"])
+        return response
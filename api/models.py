@@ -1,6 +1,10 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
 from django.utils.translation import gettext as _
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
+from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 
 from parler.models import TranslatableModel, TranslatedFields
@@ -9,6 +13,7 @@ from taggit.managers import TaggableManager
 
 from api.managers import *
 from api.services import OtpService
+from api.storage import content_storage
 from api.constants import *
 from api.utils import *
 
@@ -22,6 +27,12 @@ class Otp(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["phone", "expires_in"]),
+            models.Index(fields=["expires_in"]),
+        ]
+
     def __str__(self):
         return "OTP {} was sent to {}".format(self.code, self.phone)
     
@@ -29,8 +40,11 @@ class Otp(models.Model):
         self.phone = clean_phone(self.phone)
         if self._state.adding:
             self.code = generate_code()
-            self.expires_in = timezone.now() + timezone.timedelta(minutes=1)
-            OtpService(self)
+            self.expires_in = timezone.now() + timezone.timedelta(seconds=settings.OTP_LIFETIME)
+            with transaction.atomic():
+                result = super(Otp, self).save(*args, **kwargs)
+                OtpService(self)
+            return result
         return super(Otp, self).save(*args, **kwargs)
     
     def is_expired(self, datetime):
@@ -43,6 +57,39 @@ class Otp(models.Model):
         return self.code == str(code)
 
 
+class OtpOutbox(models.Model):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS = [
+        (PENDING, _("Pending")),
+        (SENT, _("Sent")),
+        (FAILED, _("Failed")),
+    ]
+    phone = models.CharField(max_length=20, verbose_name=_("Phone number"))
+    code = models.CharField(max_length=8, verbose_name=_("Otp code"))
+    status = models.CharField(max_length=20, choices=STATUS, default=PENDING, verbose_name=_("Status"))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_("Attempts"))
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name=_("Next attempt at"))
+    last_error = models.TextField(blank=True, default="", verbose_name=_("Last error"))
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Sent at"))
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return "OTP to {} ({})".format(self.phone, self.status)
+
+    @property
+    def text(self):
+        return OTP_SMS_TEXT.format(code=self.code)
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     phone = models.CharField(max_length=20, unique=True, verbose_name=_("Phone number"))
     is_staff = models.BooleanField(default=True)
@@ -68,6 +115,16 @@ class User(AbstractBaseUser, PermissionsMixin):
         return super().save(*args, **kwargs)
 
 
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=255, unique=True, verbose_name=_("Token ID"))
+    expires_at = models.DateTimeField(db_index=True, verbose_name=_("Expires at"))
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
 class Client(models.Model):
     CLIENT_TYPE_CHOICES = [
         (INDIVIDUAL, _(INDIVIDUAL.capitalize().replace("_", " "))),
@@ -78,27 +135,36 @@ class Client(models.Model):
     balance = models.FloatField(default=0.0)
     coins = models.IntegerField(default=0)
     client_type = models.CharField(max_length=30, choices=CLIENT_TYPE_CHOICES, null=True, verbose_name=_("Client type"))
-    type_related_info = models.IntegerField(null=True, verbose_name=_("Related info"))
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def set_individual(self, id):
-        self.type_related_info = id
+    objects = ClientQuerySet.as_manager()
+
+    @property
+    def details(self):
+        related_name = {INDIVIDUAL: "individual", LEGAL_ENTITY: "legal_entity"}.get(self.client_type)
+        if related_name is None:
+            return None
+        try:
+            return getattr(self, related_name)
+        except ObjectDoesNotExist:
+            return None
+
+    @property
+    def type_related_info(self):
+        details = self.details
+        return details.id if details else None
+
+    def set_individual(self):
         self.client_type = self.CLIENT_TYPE_CHOICES[0][0]
     
-    def set_legal_entity(self, id):
-        self.type_related_info = id
+    def set_legal_entity(self):
         self.client_type = self.CLIENT_TYPE_CHOICES[1][0]
-    
-    def delete(self, *args, **kwargs):
-        individual = Individual.objects.filter(client=self.id)
-        individual.delete()
-        return super().delete(*args, **kwargs)
 
 
 class Individual(models.Model):
-    client = models.IntegerField(default=0)
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, null=True, blank=True, related_name="individual")
     fullname = models.CharField(max_length=125, verbose_name=_("Fullname"))
     email = models.EmailField(max_length=255, null=True, blank=True, verbose_name=_("Email"))
     passport_series = models.CharField(max_length=10, verbose_name=_("Passport series"))
@@ -113,16 +179,9 @@ class Individual(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def delete(self, *args, **kwargs):
-        clients = Client.objects.filter(pk=self.client)
-        for client in clients:
-            client.set_individual(0)
-            client.save()
-        super(Individual, self).delete(*args, **kwargs)
-
 
 class LegalEntity(models.Model):
-    client = models.IntegerField(default=0)
+    client = models.OneToOneField(Client, on_delete=models.SET_NULL, null=True, blank=True, related_name="legal_entity")
     fullname = models.CharField(max_length=125, verbose_name=_("Fullname"))
     company = models.CharField(max_length=255, verbose_name=_("Company"))
     bank_name = models.CharField(max_length=255, verbose_name=_("Bank name"))
@@ -141,13 +200,6 @@ class LegalEntity(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def delete(self, *args, **kwargs):
-        clients = Client.objects.filter(pk=self.client)
-        for client in clients:
-            client.set_legal_entity(0)
-            client.save()
-        super(LegalEntity, self).delete(*args, **kwargs)
-
 
 class ProjectCategory(MPTTModel, TranslatableModel):
     parent = models.ForeignKey("self", related_name="children", on_delete=models.SET_NULL, null=True, blank=True)
@@ -222,9 +274,21 @@ class Project(models.Model):
 
     tags = TaggableManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"]),
+            models.Index(fields=["status", "worker_type", "-created_at"]),
+            models.Index(fields=["project_category", "status", "-created_at"]),
+            models.Index(fields=["freelancer_category", "status", "-created_at"]),
+            models.Index(fields=["status", "price"]),
+            models.Index(fields=["status", "deadline"]),
+        ]
+
 
 class ProjectPhoto(models.Model):
-    photo = models.FileField(upload_to="images/project/")
+    BLOB_FIELD = "photo"
+
+    photo = models.FileField(upload_to="images/project/", storage=content_storage)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="photos")
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -232,7 +296,9 @@ class ProjectPhoto(models.Model):
 
 
 class ProjectFile(models.Model):
-    file = models.FileField(upload_to="files/project/")
+    BLOB_FIELD = "file"
+
+    file = models.FileField(upload_to="files/project/", storage=content_storage)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="files")
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -240,7 +306,48 @@ class ProjectFile(models.Model):
     
 
 class TempFile(models.Model):
+    BLOB_FIELD = "file"
+
+    file = models.FileField(upload_to="files/temp/", storage=content_storage)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class Blob(models.Model):
+    name = models.CharField(max_length=255, unique=True, verbose_name=_("Name"))
+    references = models.IntegerField(default=0, verbose_name=_("References"))
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["references", "updated_at"]),
+        ]
+
+    def __str__(self):
+        return "{} ({})".format(self.name, self.references)
+
+
+class ChunkedUpload(models.Model):
+    UPLOADING = "uploading"
+    COMPLETE = "complete"
+    STATUS = [
+        (UPLOADING, _("Uploading")),
+        (COMPLETE, _("Complete")),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     file = models.FileField(upload_to="files/temp/")
+    filename = models.CharField(max_length=255, verbose_name=_("File name"))
+    size = models.PositiveBigIntegerField(verbose_name=_("Size"))
+    offset = models.PositiveBigIntegerField(default=0, verbose_name=_("Offset"))
+    sha256 = models.CharField(max_length=64, blank=True, default="", verbose_name=_("SHA-256"))
+    status = models.CharField(max_length=20, choices=STATUS, default=UPLOADING, verbose_name=_("Status"))
+    temp_file = models.OneToOneField(TempFile, on_delete=models.SET_NULL, null=True, blank=True, related_name="upload")
 
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
\ No newline at end of file
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{} ({}/{})".format(self.filename, self.offset, self.size)
@@ -0,0 +1,88 @@
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.errors_details import *
+from api.models import Otp
+from api.services import OtpService
+from api.utils import clean_phone, generate_code
+
+
+class DatabaseOtpStore:
+    """
+    Keeps every code as an `Otp` row. This is the default storage.
+    """
+
+    def create(self, phone):
+        return Otp.objects.create(phone=phone)
+
+    def validate(self, pk, code):
+        otp = Otp.objects.get(id=pk)
+        if otp.is_expired(timezone.now()):
+            return OTP_EXPIRED
+        if not otp.check_code(code):
+            return WRONG_OTP_CODE
+        otp.activate()
+        otp.save()
+        return None
+
+
+class CacheOtpStore:
+    """
+    Keeps codes in the Django cache with native expiry instead of the database.
+    Entries outlive the code by OTP_CACHE_RETENTION seconds so that late
+    attempts are reported as expired rather than unknown.
+    """
+
+    def __init__(self):
+        self.cache = caches[settings.OTP_CACHE_ALIAS]
+
+    def _key(self, pk, suffix=""):
+        return "otp:{}{}".format(pk, suffix)
+
+    def create(self, phone):
+        now = timezone.now()
+        otp = Otp(
+            phone=clean_phone(phone),
+            code=generate_code(),
+            expires_in=now + timezone.timedelta(seconds=settings.OTP_LIFETIME),
+            activated=False,
+            created_at=now,
+        )
+        timeout = settings.OTP_LIFETIME + settings.OTP_CACHE_RETENTION
+        value = {"phone": otp.phone, "code": otp.code, "expires_in": otp.expires_in}
+        # 53 bits keeps the id exact in JavaScript clients
+        otp.id = secrets.randbits(53)
+        while not self.cache.add(self._key(otp.id), value, timeout):
+            otp.id = secrets.randbits(53)
+        self.cache.add(self._key(otp.id, ":attempts"), 0, timeout)
+        OtpService(otp)
+        return otp
+
+    def validate(self, pk, code):
+        value = self.cache.get(self._key(pk))
+        if value is None:
+            raise Otp.DoesNotExist()
+        if value["expires_in"] < timezone.now():
+            return OTP_EXPIRED
+        try:
+            attempts = self.cache.incr(self._key(pk, ":attempts"))
+        except ValueError:
+            return OTP_EXPIRED
+        if attempts > settings.OTP_MAX_ATTEMPTS:
+            return OTP_ATTEMPTS_EXCEEDED
+        if value["code"] != str(code):
+            return WRONG_OTP_CODE
+        # add() only succeeds for the first caller, which makes it the
+        # compare-and-set that flips the code to activated
+        timeout = settings.OTP_LIFETIME + settings.OTP_CACHE_RETENTION
+        if not self.cache.add(self._key(pk, ":activated"), True, timeout):
+            return OTP_EXPIRED
+        return None
+
+
+def get_otp_store():
+    return import_string(settings.OTP_STORAGE)()
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher
+
+
+class PasswordCheckBusy(Exception):
+    pass
+
+
+class PasswordCheckPool:
+    """
+    Runs password hashing on a small dedicated thread pool. hashlib releases
+    the GIL while hashing, so checks run in parallel without tying up more
+    than LOGIN_HASH_WORKERS cores. At most LOGIN_HASH_MAX_PENDING checks may
+    be running or queued; further logins are rejected instead of waiting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+
+    def _setup(self):
+        with self._lock:
+            if self._executor is None:
+                self._slots = threading.BoundedSemaphore(settings.LOGIN_HASH_MAX_PENDING)
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.LOGIN_HASH_WORKERS,
+                    thread_name_prefix="password-check",
+                )
+
+    def check(self, user, password):
+        if self._executor is None:
+            self._setup()
+        if not self._slots.acquire(blocking=False):
+            raise PasswordCheckBusy()
+        try:
+            encoded = user.password
+            valid = self._executor.submit(check_password, password, encoded).result()
+        finally:
+            self._slots.release()
+
+        if valid and self.must_update(encoded):
+            # Same upgrade AbstractBaseUser.check_password() does, kept on
+            # the request thread so pool threads never open connections
+            user.set_password(password)
+            user.save(update_fields=["password"])
+        return valid
+
+    def must_update(self, encoded):
+        try:
+            hasher = identify_hasher(encoded)
+        except ValueError:
+            return False
+        preferred = get_hasher()
+        return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+password_check_pool = PasswordCheckPool()
@@ -0,0 +1,11 @@
+from rest_framework.permissions import BasePermission
+
+
+class IsSuperUser(BasePermission):
+    """
+    Allows superusers only. IsAdminUser checks is_staff, which every
+    signed-up user has.
+    """
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_superuser)
@@ -0,0 +1,87 @@
+import json
+import marshal
+import os
+import re
+import shutil
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from api.utils import open_private
+
+
+PROFILE_HEADER = "X-Profile"
+SALT = "api.profiling"
+
+
+def profile_token():
+    """
+    Value for the X-Profile header that makes the server profile a request.
+    It is signed with SECRET_KEY and valid for PROFILE_TOKEN_MAX_AGE seconds.
+    """
+    return signing.TimestampSigner(salt=SALT).sign("profile")
+
+
+def is_profile_requested(request):
+    value = request.headers.get(PROFILE_HEADER)
+    if not value:
+        return False
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(value, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def route_directory(route):
+    return os.path.join(settings.PROFILE_DIR, re.sub(r"[^\w.-]", "_", route))
+
+
+def save_capture(route, request_id, profile, queries, meta):
+    """
+    Writes profile.prof, queries.json and meta.json to
+    PROFILE_DIR/<route>/<timestamp>-<request id>/ and drops the oldest
+    captures of the route beyond PROFILE_MAX_PER_ROUTE. Only the user
+    running the server can read them.
+    """
+    parent = route_directory(route)
+    directory = os.path.join(parent, "{}-{}".format(timezone.now().strftime("%Y%m%dT%H%M%S%f"), request_id))
+    os.makedirs(settings.PROFILE_DIR, mode=0o700, exist_ok=True)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # What Profile.dump_stats() writes, through a private file
+    profile.create_stats()
+    with open_private(os.path.join(directory, "profile.prof"), "wb") as f:
+        marshal.dump(profile.stats, f)
+    with open_private(os.path.join(directory, "queries.json")) as f:
+        json.dump(queries, f, indent=1)
+    with open_private(os.path.join(directory, "meta.json")) as f:
+        json.dump(meta, f, indent=1)
+
+    captures = sorted(entry for entry in os.listdir(parent) if not entry.startswith("."))
+    for entry in captures[:-settings.PROFILE_MAX_PER_ROUTE]:
+        shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+    return directory
+
+
+class QueryRecorder:
+    """
+    execute_wrapper that keeps every statement of a request with its time.
+    Parameters are left out, they hold codes, password hashes and
+    personal data.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "sql": sql,
+                "many": many,
+                "duration": time.perf_counter() - started,
+            })
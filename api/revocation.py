@@ -0,0 +1,121 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from api.models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Bit array sized for `capacity` keys at the given false positive rate.
+    Bit positions come from one blake2b digest split into two hashes.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+
+class RevocationList:
+    """
+    Per-process view of RevokedToken. Lookups only reach the database when
+    the Bloom filter reports a hit. Rows written by other processes are
+    pulled in every REVOCATION_SYNC_INTERVAL seconds, and the filter is
+    rebuilt from live rows every REVOCATION_REBUILD_INTERVAL seconds so
+    expired revocations drop out of it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._synced_at = None
+        self._checked = 0
+        self._built = 0
+
+    def build(self):
+        now = timezone.now()
+        rows = RevokedToken.objects.filter(expires_at__gt=now)
+        capacity = max(rows.count() * 2, settings.REVOCATION_BLOOM_MIN_CAPACITY)
+        bloom = BloomFilter(capacity, settings.REVOCATION_BLOOM_ERROR_RATE)
+        for jti in rows.values_list("jti", flat=True).iterator(chunk_size=10000):
+            bloom.add(jti)
+        self._filter = bloom
+        self._synced_at = now
+
+    def sync(self):
+        # Rows are picked up by creation time with an overlap, so transactions
+        # that committed after the previous sync started are not missed
+        now = timezone.now()
+        since = self._synced_at - timezone.timedelta(seconds=settings.REVOCATION_SYNC_OVERLAP)
+        for jti in RevokedToken.objects.filter(created_at__gte=since).values_list("jti", flat=True):
+            self._filter.add(jti)
+        self._synced_at = now
+
+    def refresh(self):
+        if time.monotonic() - self._checked < settings.REVOCATION_SYNC_INTERVAL:
+            return
+        # While another thread refreshes, keep answering from the current filter
+        if not self._lock.acquire(blocking=self._filter is None):
+            return
+        try:
+            now = time.monotonic()
+            if now - self._checked < settings.REVOCATION_SYNC_INTERVAL:
+                return
+            if (
+                self._filter is None
+                or now - self._built >= settings.REVOCATION_REBUILD_INTERVAL
+                or self._filter.count > self._filter.capacity
+            ):
+                self.build()
+                self._built = now
+            else:
+                self.sync()
+            self._checked = now
+        finally:
+            self._lock.release()
+
+    def is_revoked(self, jti):
+        self.refresh()
+        if jti not in self._filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        RevokedToken.objects.get_or_create(jti=jti, defaults={"expires_at": expires_at})
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+
+revocation_list = RevocationList()
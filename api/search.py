@@ -0,0 +1,269 @@
+import html
+import re
+
+from django.conf import settings
+from django.db import connection as default_connection
+
+
+# Private use characters, swapped for <mark> tags after escaping
+START_MARK = "\ue000"
+END_MARK = "\ue001"
+
+
+class SearchHit:
+    def __init__(self, id, rank, title, description):
+        self.id = id
+        self.rank = rank
+        self.title = self._highlight(title)
+        self.description = self._highlight(description)
+
+    def _highlight(self, value):
+        # Project text is user content, so escape it before adding markup
+        return html.escape(value or "").replace(START_MARK, "<mark>").replace(END_MARK, "</mark>")
+
+
+class PostgresProjectSearch:
+    """
+    Keeps a weighted `search_vector` tsvector column on api_project, filled by
+    a trigger and covered by a GIN index. Titles and descriptions are indexed
+    with every configured text search config so both stemmed Russian and
+    unstemmed Uzbek words match.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def configs(self):
+        return sorted(set(settings.SEARCH_CONFIGS.values()))
+
+    def config_for(self, language):
+        return settings.SEARCH_CONFIGS.get(language, "simple")
+
+    def vector_sql(self, prefix):
+        parts = []
+        for field, weight in (("title", "A"), ("description", "B")):
+            for config in self.configs():
+                parts.append(
+                    "setweight(to_tsvector('pg_catalog.{}', coalesce({}{}, '')), '{}')".format(config, prefix, field, weight)
+                )
+        return " || ".join(parts)
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'api_project' AND column_name = 'search_vector'"
+            )
+            created = cursor.fetchone() is None
+            cursor.execute("ALTER TABLE api_project ADD COLUMN IF NOT EXISTS search_vector tsvector")
+            cursor.execute(
+                """
+                CREATE OR REPLACE FUNCTION api_project_search_vector_update() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector := {};
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+                """.format(self.vector_sql("NEW."))
+            )
+            cursor.execute("DROP TRIGGER IF EXISTS api_project_search_vector_trigger ON api_project")
+            cursor.execute(
+                "CREATE TRIGGER api_project_search_vector_trigger "
+                "BEFORE INSERT OR UPDATE OF title, description ON api_project "
+                "FOR EACH ROW EXECUTE PROCEDURE api_project_search_vector_update()"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS api_project_search_vector_idx ON api_project USING gin (search_vector)"
+            )
+        if created:
+            self.rebuild()
+
+    def repair(self):
+        pass
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER IF EXISTS api_project_search_vector_trigger ON api_project")
+            cursor.execute("DROP FUNCTION IF EXISTS api_project_search_vector_update()")
+            cursor.execute("ALTER TABLE api_project DROP COLUMN IF EXISTS search_vector")
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("UPDATE api_project SET search_vector = {}".format(self.vector_sql("")))
+
+    def disable_sync(self):
+        # The column and index stay, search keeps serving existing rows
+        with self.connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE api_project DISABLE TRIGGER api_project_search_vector_trigger")
+
+    def enable_sync(self, after_id):
+        """
+        Turns the trigger back on and indexes the rows added since
+        disable_sync(), those with ids above `after_id`.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE api_project ENABLE TRIGGER api_project_search_vector_trigger")
+            cursor.execute(
+                "UPDATE api_project SET search_vector = {} WHERE id > %s".format(self.vector_sql("")), [after_id]
+            )
+
+    def search(self, query, language, limit, offset):
+        config = self.config_for(language)
+        options = "StartSel={}, StopSel={}, MaxFragments=2, MaxWords=30".format(START_MARK, END_MARK)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT p.id,
+                       ts_rank_cd(p.search_vector, q.query) AS rank,
+                       ts_headline(%s::regconfig, p.title, q.query, 'HighlightAll=true, ' || %s),
+                       ts_headline(%s::regconfig, p.description, q.query, %s)
+                FROM api_project p,
+                     (SELECT websearch_to_tsquery(%s::regconfig, %s) || websearch_to_tsquery('simple', %s) AS query) q
+                WHERE p.search_vector @@ q.query
+                ORDER BY rank DESC, p.id DESC
+                LIMIT %s OFFSET %s
+                """,
+                [config, options, config, options, config, query, query, limit, offset],
+            )
+            return [SearchHit(*row) for row in cursor.fetchall()]
+
+
+class SqliteProjectSearch:
+    """
+    FTS5 external-content table over api_project, kept in sync by triggers.
+    Used for local development. Words are not stemmed, so they match only in
+    their exact form, like the Uzbek "simple" config on PostgreSQL.
+    """
+
+    triggers = {
+        "api_project_fts_insert": (
+            "AFTER INSERT ON api_project BEGIN "
+            "INSERT INTO api_project_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+            "END"
+        ),
+        "api_project_fts_delete": (
+            "AFTER DELETE ON api_project BEGIN "
+            "INSERT INTO api_project_fts(api_project_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            "END"
+        ),
+        "api_project_fts_update": (
+            "AFTER UPDATE OF title, description ON api_project BEGIN "
+            "INSERT INTO api_project_fts(api_project_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            "INSERT INTO api_project_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+            "END"
+        ),
+    }
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'api_project_fts'")
+            created = cursor.fetchone() is None
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS api_project_fts USING fts5("
+                "title, description, content='api_project', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            for name, body in self.triggers.items():
+                cursor.execute("CREATE TRIGGER IF NOT EXISTS {} {}".format(name, body))
+        if created:
+            self.rebuild()
+
+    def repair(self):
+        # Django rebuilds SQLite tables on most schema changes, which drops
+        # the triggers of the old table
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'api_project_fts'")
+            if cursor.fetchone() is None:
+                return
+            for name, body in self.triggers.items():
+                cursor.execute("CREATE TRIGGER IF NOT EXISTS {} {}".format(name, body))
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            for name in self.triggers:
+                cursor.execute("DROP TRIGGER IF EXISTS {}".format(name))
+            cursor.execute("DROP TABLE IF EXISTS api_project_fts")
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("INSERT INTO api_project_fts(api_project_fts) VALUES ('rebuild')")
+
+    def disable_sync(self):
+        # SQLite triggers can not be disabled, they are dropped instead
+        with self.connection.cursor() as cursor:
+            for name in self.triggers:
+                cursor.execute("DROP TRIGGER IF EXISTS {}".format(name))
+
+    def enable_sync(self, after_id):
+        with self.connection.cursor() as cursor:
+            for name, body in self.triggers.items():
+                cursor.execute("CREATE TRIGGER IF NOT EXISTS {} {}".format(name, body))
+            cursor.execute(
+                "INSERT INTO api_project_fts(rowid, title, description) "
+                "SELECT id, title, description FROM api_project WHERE id > %s",
+                [after_id],
+            )
+
+    def match_expression(self, query):
+        terms = re.findall(r"\w+", query)
+        return " ".join('"{}"'.format(term) for term in terms)
+
+    def search(self, query, language, limit, offset):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT rowid,
+                       -bm25(api_project_fts, 10.0, 1.0) AS rank,
+                       highlight(api_project_fts, 0, %s, %s),
+                       snippet(api_project_fts, 1, %s, %s, '...', 30)
+                FROM api_project_fts
+                WHERE api_project_fts MATCH %s
+                ORDER BY rank DESC, rowid DESC
+                LIMIT %s OFFSET %s
+                """,
+                [START_MARK, END_MARK, START_MARK, END_MARK, expression, limit, offset],
+            )
+            return [SearchHit(*row) for row in cursor.fetchall()]
+
+
+class NullProjectSearch:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        pass
+
+    def repair(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def disable_sync(self):
+        pass
+
+    def enable_sync(self, after_id):
+        pass
+
+    def search(self, query, language, limit, offset):
+        return []
+
+
+def get_project_search(connection=None):
+    connection = connection or default_connection
+    backends = {
+        "postgresql": PostgresProjectSearch,
+        "sqlite": SqliteProjectSearch,
+    }
+    return backends.get(connection.vendor, NullProjectSearch)(connection)
@@ -1,10 +1,27 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from django.utils.translation import gettext as _
 from wsgiref.validate import validator
 from rest_framework import serializers
 from parler_rest.serializers import TranslatableModelSerializer, TranslatedFieldsField
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
 
 
 from api.models import *
+from api.authentication import is_superseded
+from api.blobs import acquire
 from api.mixins import TranslatedSerializerMixin
+from api.revocation import revocation_list
+from api.variants import rendered_variant
 from api.validators import validate_freelancer_category_id, validate_project_category_id, validate_status_client_project
 
 
@@ -75,18 +92,10 @@ class IndividualCreateSerializer(VariableModelSerializer):
         fields = "__all__"
 
     def create(self, validated_data):
-        client_id = validated_data.get("client", 0)
         individual = super().create(validated_data)
-        if client_id:
-            client = Client.objects.filter(id=client_id)
-            if client.exists():
-                client = client.first()
-                client.set_individual(individual.id)
-                client.save()
-                individual.client = client_id
-            else:
-                individual.client = 0
-            individual.save()
+        if individual.client:
+            individual.client.set_individual()
+            individual.client.save()
         return individual
 
 
@@ -108,18 +117,10 @@ class LegalEntityCreateSerializer(VariableModelSerializer):
         fields = "__all__"
 
     def create(self, validated_data):
-        client_id = validated_data.get("client", 0)
         legal_entity = super().create(validated_data)
-        if client_id:
-            client = Client.objects.filter(id=client_id)
-            if client.exists():
-                client = client.first()
-                client.set_legal_entity(legal_entity.id)
-                client.save()
-                legal_entity.client = client_id
-            else:
-                legal_entity.client = 0
-            legal_entity.save()
+        if legal_entity.client:
+            legal_entity.client.set_legal_entity()
+            legal_entity.client.save()
         return legal_entity
 
 
@@ -150,16 +151,11 @@ class ClientGetSerializer(VariableModelSerializer):
         }
     
     def get_details(self, obj):
-        if obj.client_type == INDIVIDUAL:
-            individual = Individual.objects.filter(id=obj.type_related_info)
-            if individual.exists():
-                individual = individual.first()
-                return {**IndividualGetSerializer(individual).data}
-        if obj.client_type == LEGAL_ENTITY:
-            legal_entity = LegalEntity.objects.filter(id=obj.type_related_info)
-            if legal_entity.exists():
-                legal_entity = legal_entity.first()
-                return {**LegalEntityGetSerializer(legal_entity).data}
+        details = obj.details
+        if isinstance(details, Individual):
+            return {**IndividualGetSerializer(details).data}
+        if isinstance(details, LegalEntity):
+            return {**LegalEntityGetSerializer(details).data}
         return None
 
 
@@ -228,12 +224,50 @@ class JwtTokenSerializer(serializers.Serializer):
         return super().validate(attrs)
 
 
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        if is_superseded(refresh) or revocation_list.is_revoked(refresh[jwt_settings.JTI_CLAIM]):
+            raise InvalidToken()
+        return super().validate(attrs)
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        expires_at = datetime_from_epoch(refresh["exp"])
+        revocation_list.revoke(refresh[jwt_settings.JTI_CLAIM], expires_at)
+        return {"status": True}
+
+
 class TempFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = TempFile
         fields = ["id", "file"]
 
 
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    temp_file = TempFileSerializer(read_only=True)
+
+    class Meta:
+        model = ChunkedUpload
+        fields = ["id", "filename", "size", "offset", "sha256", "status", "temp_file"]
+        read_only_fields = ["offset", "sha256", "status"]
+
+    def validate_filename(self, value):
+        try:
+            return default_storage.get_valid_name(os.path.basename(value))
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError(_("Invalid file name"))
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(_("Files up to {} bytes are accepted").format(settings.UPLOAD_MAX_SIZE))
+        return value
+
+
 class ProjectCategorySerializer(TransModelSerializer):
     translations = TranslatedFieldsField(shared_model=ProjectCategory)
 
@@ -262,7 +296,7 @@ class ProjectCreateUpdateSerializer(serializers.Serializer):
     deadline = serializers.DateField()
     pro_task = serializers.BooleanField(default=False)
     status = serializers.CharField(max_length=255, validators=[validate_status_client_project])
-    files = serializers.ListField()
+    files = serializers.ListField(child=serializers.IntegerField(), required=False)
 
     def validate(self, attrs):
         attrs = super().validate(attrs)
@@ -281,20 +315,71 @@ class ProjectCreateUpdateSerializer(serializers.Serializer):
         except:
             raise serializers.ValidationError("Freelancer category with the ID ({}) does not exist.".format(freelancer_category_id))
         
-        file_ids = attrs["files"]
-        existing_files = []
-        for _id in file_ids:
-            try:
-                temp_file = TempFile.objects.get(id=_id)
-                existing_files.append(temp_file)
-            except:
-                pass
-        attrs["files"] = existing_files
+        file_ids = list(dict.fromkeys(attrs.get("files", [])))
+        temp_files = TempFile.objects.in_bulk(file_ids)
+        missing = [str(_id) for _id in file_ids if _id not in temp_files]
+        if missing:
+            raise serializers.ValidationError({"files": "Files with the IDs ({}) do not exist.".format(", ".join(missing))})
+        attrs["files"] = [temp_files[_id] for _id in file_ids]
         
         return attrs
 
+    def create(self, validated_data):
+        temp_files = validated_data.pop("files", [])
+        with transaction.atomic():
+            # Deleting first claims the files, a concurrent request using
+            # the same ones deletes fewer rows and is rolled back
+            if temp_files:
+                deleted = TempFile.objects.filter(id__in=[temp_file.id for temp_file in temp_files]).delete()[1]
+                if deleted.get(TempFile._meta.label, 0) != len(temp_files):
+                    raise serializers.ValidationError({"files": "Files were attached to another project."})
+            project = Project.objects.create(**validated_data)
+            # The stored files are re-pointed to the project, not copied.
+            # bulk_create sends no signals, so the blobs are referenced here
+            ProjectFile.objects.bulk_create([
+                ProjectFile(project=project, file=temp_file.file.name) for temp_file in temp_files
+            ])
+            acquire([temp_file.file.name for temp_file in temp_files])
+        return project
+
+
+class ProjectPhotoSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProjectPhoto
+        fields = ["id", "photo", "variants"]
+
+    def get_variants(self, obj):
+        # Variants not rendered yet link to the endpoint that renders them
+        request = self.context.get("request")
+        variants = {}
+        for variant in settings.PHOTO_VARIANTS:
+            rendered = rendered_variant(obj.photo.name, variant)
+            if rendered:
+                url = obj.photo.storage.url(rendered)
+            else:
+                url = reverse("project-photo-variant", kwargs={"pk": obj.pk, "variant": variant})
+            variants[variant] = request.build_absolute_uri(url) if request else url
+        return variants
+
+
+class ProjectFileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProjectFile
+        fields = ["id", "file"]
+
 
 class ProjectGetSerializer(serializers.ModelSerializer):
+    tags = serializers.SlugRelatedField(many=True, read_only=True, slug_field="name")
+    photos = ProjectPhotoSerializer(many=True, read_only=True)
+    files = ProjectFileSerializer(many=True, read_only=True)
+
     class Meta:
         model = Project
-        fields = "__all__"
\ No newline at end of file
+        fields = [
+            "id", "client", "title", "description", "project_category", "freelancer_category",
+            "worker_type", "price_negotiatable", "price", "deadline_negotiatable", "deadline",
+            "insurance_payment", "pro_task", "status", "tags", "photos", "files",
+            "created_at", "updated_at",
+        ]
\ No newline at end of file
@@ -1,3 +1,15 @@
+import logging
+import threading
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+
 class OtpService:
     def __init__(self, otp_obj):
         self.code = otp_obj.code
@@ -8,8 +20,146 @@ class OtpService:
     def _clean_phone(self, phone):
         from api.utils import clean_phone
         return clean_phone(phone)
-    
+
 
     def _execute(self):
-        from time import sleep
-        sleep(2)
+        from api.models import OtpOutbox
+        OtpOutbox.objects.create(phone=self.phone, code=self.code)
+        transaction.on_commit(otp_dispatcher.wake)
+
+
+class OtpDispatcher:
+    """
+    Delivers pending `OtpOutbox` rows through the configured SMS backend.
+    Runs a pool of worker threads, either inside the web process
+    (OTP_DISPATCH_IN_PROCESS) or in the `dispatch_otps` management command.
+    """
+
+    def __init__(self, workers=None, batch_size=None):
+        self._workers = workers
+        self._batch_size = batch_size
+        self._event = threading.Event()
+        self._stopping = threading.Event()
+        self._claim_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._threads = []
+        self._backend = None
+
+    @property
+    def workers(self):
+        return self._workers or settings.OTP_DISPATCH_WORKERS
+
+    @property
+    def batch_size(self):
+        return self._batch_size or settings.OTP_DISPATCH_BATCH_SIZE
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            from api.sms import get_sms_backend
+            self._backend = get_sms_backend()
+        return self._backend
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def wake(self):
+        if settings.OTP_DISPATCH_IN_PROCESS and not self.running:
+            self.start()
+        self._event.set()
+
+    def start(self):
+        with self._start_lock:
+            if self.running:
+                return
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name="otp-dispatch-{}".format(i), daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def claim(self):
+        from api.models import OtpOutbox
+        now = timezone.now()
+        lease = now + timezone.timedelta(seconds=settings.OTP_DISPATCH_LEASE)
+        # Without SKIP LOCKED (SQLite) a read-then-write transaction cannot
+        # upgrade its lock under concurrent writers, so rely on the local lock.
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        with self._claim_lock, transaction.atomic() if skip_locked else nullcontext():
+            queryset = OtpOutbox.objects.select_for_update(skip_locked=True) if skip_locked else OtpOutbox.objects
+            rows = list(
+                queryset.filter(status=OtpOutbox.PENDING, next_attempt_at__lte=now)
+                .order_by("next_attempt_at")[:self.batch_size]
+            )
+            for row in rows:
+                row.attempts += 1
+                row.next_attempt_at = lease
+            OtpOutbox.objects.bulk_update(rows, ["attempts", "next_attempt_at"])
+        return rows
+
+    def deliver(self, rows):
+        from api.models import OtpOutbox
+        from api.sms import SmsMessage
+        step = self.backend.max_batch_size
+        for start in range(0, len(rows), step):
+            chunk = rows[start:start + step]
+            messages = [SmsMessage(row.phone, row.text) for row in chunk]
+            try:
+                errors = self.backend.send_messages(messages)
+            except Exception as e:
+                logger.exception("SMS gateway call failed")
+                errors = [str(e) or e.__class__.__name__] * len(chunk)
+
+            now = timezone.now()
+            for row, error in zip(chunk, errors):
+                if error is None:
+                    row.status = OtpOutbox.SENT
+                    row.sent_at = now
+                    row.last_error = ""
+                elif row.attempts >= settings.OTP_DISPATCH_MAX_ATTEMPTS:
+                    row.status = OtpOutbox.FAILED
+                    row.last_error = error
+                else:
+                    row.last_error = error
+                    row.next_attempt_at = now + self.backoff(row.attempts)
+            OtpOutbox.objects.bulk_update(chunk, ["status", "sent_at", "last_error", "next_attempt_at"])
+
+    def backoff(self, attempts):
+        seconds = settings.OTP_DISPATCH_BACKOFF * 2 ** (attempts - 1)
+        return timezone.timedelta(seconds=min(seconds, settings.OTP_DISPATCH_MAX_BACKOFF))
+
+    def dispatch_once(self):
+        rows = self.claim()
+        if rows:
+            self.deliver(rows)
+        return len(rows)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._event.clear()
+            close_old_connections()
+            try:
+                sent = self.dispatch_once()
+            except Exception:
+                logger.exception("OTP dispatch failed")
+                sent = 0
+            if not sent:
+                self._event.wait(settings.OTP_DISPATCH_POLL_INTERVAL)
+        connection.close()
+
+
+otp_dispatcher = OtpDispatcher()
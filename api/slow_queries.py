@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from api.utils import open_private
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+# PostgreSQL plans repeat the parameters as literals
+PLAN_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_write_lock = threading.Lock()
+
+
+def find_origin(frame):
+    """
+    Walks up the stack of a query and returns the view method, serializer
+    and the innermost line of this project that led to it.
+    """
+    from rest_framework.serializers import BaseSerializer
+    from django.views import View
+
+    view = serializer = origin = None
+    this = os.path.abspath(__file__)
+    package = os.path.dirname(this)
+    while frame is not None:
+        instance = frame.f_locals.get("self")
+        if view is None and isinstance(instance, View):
+            view = "{}.{}".format(type(instance).__name__, frame.f_code.co_name)
+        if serializer is None and isinstance(instance, BaseSerializer):
+            serializer = type(instance).__name__
+        filename = frame.f_code.co_filename
+        if origin is None and filename.startswith(package) and filename != this:
+            origin = "{}:{}".format(os.path.relpath(filename, os.path.dirname(package)), frame.f_lineno)
+        if view is not None:
+            break
+        frame = frame.f_back
+    return view, serializer, origin
+
+
+def explain(connection, sql, params):
+    """
+    Plan of a SELECT as a list of lines, with EXPLAIN ANALYZE where the
+    backend supports it and SLOW_QUERY_EXPLAIN_ANALYZE is on. Other
+    statements are not explained, ANALYZE would run them a second time.
+    """
+    if not sql.lstrip().upper().startswith("SELECT"):
+        return None
+    options = {"analyze": True} if settings.SLOW_QUERY_EXPLAIN_ANALYZE and connection.vendor == "postgresql" else {}
+    prefix = connection.ops.explain_query_prefix(None, **options)
+    try:
+        # A savepoint keeps a failing EXPLAIN from breaking the caller's transaction
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute("{} {}".format(prefix, sql), params)
+            return [
+                PLAN_LITERAL.sub("'?'", " ".join(str(column) for column in row)) for row in cursor.fetchall()
+            ]
+    except DatabaseError as e:
+        return ["EXPLAIN failed: {}".format(e)]
+
+
+def write_entry(entry):
+    path = settings.SLOW_QUERY_LOG
+    line = json.dumps(entry, default=str) + "\n"
+    with _write_lock:
+        try:
+            if os.path.getsize(path) > settings.SLOW_QUERY_LOG_MAX_BYTES:
+                os.replace(path, path + ".1")
+        except FileNotFoundError:
+            pass
+        with open_private(path, "a") as f:
+            f.write(line)
+
+
+class SlowQueryLogger:
+    """
+    execute_wrapper that logs statements slower than SLOW_QUERY_THRESHOLD
+    milliseconds to SLOW_QUERY_LOG as JSON lines, with their plan and the
+    view and serializer that issued them. Parameters are not logged, they
+    hold codes, password hashes and personal data, and the log is only
+    readable by the user running the server.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, "active", False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if duration >= settings.SLOW_QUERY_THRESHOLD:
+                _local.active = True
+                try:
+                    self.log(sql, params, many, duration)
+                except Exception:
+                    logger.exception("Logging a slow query failed")
+                finally:
+                    _local.active = False
+
+    def log(self, sql, params, many, duration):
+        view, serializer, origin = find_origin(sys._getframe(2))
+        plan = None
+        if settings.SLOW_QUERY_EXPLAIN and not many:
+            plan = explain(self.connection, sql, params)
+        logger.warning("Slow query (%.1f ms) from %s: %s", duration, view or origin, sql)
+        write_entry({
+            "time": timezone.now().isoformat(),
+            "duration": duration,
+            "vendor": self.connection.vendor,
+            "sql": sql,
+            "view": view,
+            "serializer": serializer,
+            "origin": origin,
+            "plan": plan,
+        })
+
+
+def install_slow_query_logger(sender, connection, **kwargs):
+    # Fires again whenever the connection is reopened
+    if not any(isinstance(wrapper, SlowQueryLogger) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(SlowQueryLogger(connection))
+
+
+def connect_slow_query_log():
+    from django.db.backends.signals import connection_created
+
+    if settings.SLOW_QUERY_THRESHOLD > 0:
+        connection_created.connect(install_slow_query_logger)
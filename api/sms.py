@@ -0,0 +1,61 @@
+from collections import deque
+from time import sleep
+
+from django.conf import settings
+from django.core import checks
+from django.utils.module_loading import import_string
+
+
+class SmsMessage:
+    def __init__(self, phone, text):
+        self.phone = phone
+        self.text = text
+
+    def __repr__(self):
+        return "<SmsMessage to {}>".format(self.phone)
+
+
+class BaseSmsBackend:
+    max_batch_size = 100
+
+    def send_messages(self, messages):
+        """
+        Sends a batch of messages in a single gateway call.
+        Returns a list with one entry per message: None if it was accepted,
+        otherwise an error string. Raising means the whole batch failed.
+        """
+        raise NotImplementedError("Subclasses must implement send_messages()")
+
+
+class StubSmsBackend(BaseSmsBackend):
+    """
+    Local gateway used in development and tests, it never delivers anything.
+    The last messages are kept in `StubSmsBackend.outbox`.
+    """
+    outbox = deque(maxlen=1000)
+
+    def __init__(self, latency=None):
+        if latency is None:
+            latency = getattr(settings, "OTP_SMS_STUB_LATENCY", 0)
+        self.latency = latency
+
+    def send_messages(self, messages):
+        if self.latency:
+            sleep(self.latency)
+        StubSmsBackend.outbox.extend(messages)
+        return [None] * len(messages)
+
+
+def get_sms_backend(path=None):
+    return import_string(path or settings.OTP_SMS_BACKEND)()
+
+
+def check_sms_backend(app_configs=None, **kwargs):
+    # Users would never receive their codes, reported by `check --deploy`
+    if not settings.DEBUG and issubclass(import_string(settings.OTP_SMS_BACKEND), StubSmsBackend):
+        return [checks.Error(
+            "OTP_SMS_BACKEND must be a real SMS gateway when DEBUG is off.",
+            hint="Point OTP_SMS_BACKEND at a BaseSmsBackend subclass that delivers messages.",
+            id="api.E001",
+        )]
+    return []
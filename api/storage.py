@@ -0,0 +1,61 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+BLOB_ROOT = "blobs"
+
+
+def blob_name(digest, extension=""):
+    return "{}/{}/{}/{}{}".format(BLOB_ROOT, digest[:2], digest[2:4], digest, extension.lower())
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores files as blobs/ab/cd/<sha256><extension>. Identical content maps
+    to one file, the two prefix levels keep every directory small. Saving
+    content that is already stored replaces the file with an identical copy
+    so its mtime marks it as freshly used.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from the content, an existing file is the same file
+        return name
+
+    def _save(self, name, content):
+        directory = self.path(BLOB_ROOT)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, partial = tempfile.mkstemp(dir=directory, prefix=".partial-")
+        try:
+            sha = hashlib.sha256()
+            with os.fdopen(descriptor, "wb") as destination:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    sha.update(chunk)
+                    destination.write(chunk)
+            return self.adopt(partial, sha.hexdigest(), os.path.splitext(name)[1])
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    def adopt(self, path, digest, extension=""):
+        """
+        Moves a file already on this volume into the blob named by its
+        digest and returns the blob name.
+        """
+        name = blob_name(digest, extension)
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        os.replace(path, full_path)
+        return name
+
+
+content_storage = ContentAddressedStorage()
@@ -1,3 +1,853 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from taggit.models import Tag
+
+from api.authentication import ClaimsRefreshToken
+from api.blobs import delete_unreferenced
+from api.errors_details import PHOTO_UNREADABLE, UPLOAD_OFFSET_MISMATCH
+from api.exports import PROJECT_FIELDS
+from api.management.commands.advise_indexes import candidate_indexes, is_covered, split_clauses
+from api.models import *
+from api.revocation import revocation_list
+from api.serializers import ProjectCreateUpdateSerializer
+from api.services import OtpDispatcher
+from api.sms import BaseSmsBackend, check_sms_backend
+from api.storage import content_storage
+from api.uploads import append_chunk, finish_upload, start_upload
+from api.variants import variant_name, variant_pool
+
+
+PASSWORD = "password"
+LANGUAGES = ["uz", "ru"]
+TAGS = ["python", "django", "design", "mobile", "marketing"]
+
+
+def seed_categories(model, offset, count):
+    # MPTT fields are set by hand, every tree is a root with one child
+    roots = [
+        model(slug="{}-root-{}".format(model._meta.model_name, i), tree_id=i + 1, lft=1, rght=4, level=0)
+        for i in range(offset, offset + count)
+    ]
+    model.objects.bulk_create(roots)
+    roots = model.objects.filter(slug__in=[root.slug for root in roots])
+    model.objects.bulk_create([
+        model(slug=root.slug.replace("root", "child"), parent=root, tree_id=root.tree_id, lft=2, rght=3, level=1)
+        for root in roots
+    ])
+    translation_model = model._parler_meta.root_model
+    nodes = model.objects.filter(tree_id__gt=offset, tree_id__lte=offset + count)
+    translation_model.objects.bulk_create([
+        translation_model(master=node, language_code=language, title="{} {}".format(language, node.slug))
+        for node in nodes
+        for language in LANGUAGES
+    ])
+
+
+def seed(offset, count):
+    """
+    Adds `count` rows of every kind the API serves, numbered from `offset`.
+    """
+    password = make_password(PASSWORD)
+    phones = ["99891{:07d}".format(i) for i in range(offset, offset + count)]
+    User.objects.bulk_create([User(phone=phone, password=password) for phone in phones])
+    users = User.objects.filter(phone__in=phones).order_by("id")
+    Client.objects.bulk_create([
+        Client(user=user, fullname="Client {}".format(user.phone), client_type=INDIVIDUAL if i % 2 else LEGAL_ENTITY)
+        for i, user in enumerate(users)
+    ])
+    clients = list(Client.objects.filter(user__phone__in=phones).order_by("id"))
+    Individual.objects.bulk_create([
+        Individual(
+            client=client, fullname=client.fullname, passport_series="AA", passport_number="1234567",
+            passport_given_date="2020-01-01", passport_issued_address="Tashkent", country="Uzbekistan",
+            region="Tashkent", city="Tashkent", address="Street 1",
+        )
+        for client in clients if client.client_type == INDIVIDUAL
+    ])
+    LegalEntity.objects.bulk_create([
+        LegalEntity(
+            client=client, fullname=client.fullname, company="Company", bank_name="Bank", bank_account="1",
+            mfo="1", inn="1", country="Uzbekistan", region="Tashkent", city="Tashkent", post_code="100000",
+            address="Street 1", telegram_phone="998901234567", email="owner@example.com",
+        )
+        for client in clients if client.client_type == LEGAL_ENTITY
+    ])
+
+    seed_categories(ProjectCategory, offset, count)
+    seed_categories(FreelancerCategory, offset, count)
+    project_category = ProjectCategory.objects.order_by("id").first()
+    freelancer_category = FreelancerCategory.objects.order_by("id").first()
+
+    titles = ["Project {}".format(i) for i in range(offset, offset + count)]
+    Project.objects.bulk_create([
+        Project(
+            client=clients[i % len(clients)], title=title, description="Build a mobile app {}".format(title),
+            project_category=project_category, freelancer_category=freelancer_category,
+            worker_type="freelancer", price=100 + i, deadline="2030-01-01", status="published",
+        )
+        for i, title in enumerate(titles)
+    ])
+    projects = list(Project.objects.filter(title__in=titles))
+    tags = [Tag.objects.get_or_create(name=name, slug=name)[0] for name in TAGS]
+    content_type = ContentType.objects.get_for_model(Project)
+    Project.tags.through.objects.bulk_create([
+        Project.tags.through(tag=tag, content_type=content_type, object_id=project.id)
+        for project in projects
+        for tag in tags[project.id % len(tags):][:2]
+    ])
+    ProjectPhoto.objects.bulk_create([
+        ProjectPhoto(project=project, photo="blobs/00/00/photo-{}-{}.jpg".format(project.id, n))
+        for project in projects
+        for n in range(2)
+    ])
+    ProjectFile.objects.bulk_create([
+        ProjectFile(project=project, file="blobs/00/00/file-{}-{}.pdf".format(project.id, n))
+        for project in projects
+        for n in range(2)
+    ])
+
+    TempFile.objects.bulk_create([TempFile(file="blobs/00/00/temp-{}.pdf".format(i)) for i in range(offset, offset + count)])
+    expires = timezone.now() + timezone.timedelta(minutes=1)
+    Otp.objects.bulk_create([
+        Otp(phone=phone, code="123456", expires_in=expires) for phone in phones
+    ])
+    RevokedToken.objects.bulk_create([
+        RevokedToken(jti="revoked-{}".format(i), expires_at=expires) for i in range(offset, offset + count)
+    ])
+
+
+class TemporaryMediaMixin:
+    """
+    Points MEDIA_ROOT at a fresh directory for every test and removes it
+    afterwards, so uploaded files never reach the real media folder.
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+@override_settings(
+    OTP_DISPATCH_IN_PROCESS=False,
+    PHOTO_VARIANTS_ON_SAVE=False,
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class QueryBudgetTests(TemporaryMediaMixin, TestCase):
+    """
+    Every endpoint is called with 10 and with 1000 rows of each model in the
+    database. The query count has to be the same for both and stay within
+    the budget, so a query per row fails here instead of in production.
+    """
+
+    sizes = (10, 1000)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.seeded = 0
+        self.user = User.objects.create_user(phone="998900000001", password=PASSWORD)
+        self.client_obj = Client.objects.create(user=self.user, fullname="Owner", client_type=INDIVIDUAL)
+        self.individual = Individual.objects.create(
+            client=self.client_obj, fullname="Owner", passport_series="AA", passport_number="1",
+            passport_given_date="2020-01-01", passport_issued_address="Tashkent", country="Uzbekistan",
+            region="Tashkent", city="Tashkent", address="Street 1",
+        )
+        self.legal_entity = LegalEntity.objects.create(
+            fullname="Owner", company="Company", bank_name="Bank", bank_account="1", mfo="1", inn="1",
+            country="Uzbekistan", region="Tashkent", city="Tashkent", post_code="100000", address="Street 1",
+            telegram_phone="998901234567", email="owner@example.com",
+        )
+
+    def grow(self, size):
+        if size > self.seeded:
+            seed(self.seeded, size - self.seeded)
+            self.seeded = size
+
+    def assertQueryBudget(self, budget, request, prepare=None):
+        """
+        Calls `request` once per fixture size. `prepare` runs before each
+        call, outside the measured block, to build per-call input.
+        """
+        counts = []
+        for size in self.sizes:
+            self.grow(size)
+            cache.clear()
+            argument = prepare() if prepare else None
+            with CaptureQueriesContext(connection) as context:
+                response = request(argument) if prepare else request()
+            self.assertLess(response.status_code, 400, getattr(response, "data", response))
+            counts.append(len(context))
+        self.assertEqual(
+            len(set(counts)), 1,
+            "Query count depends on the number of rows: {}".format(dict(zip(self.sizes, counts))),
+        )
+        self.assertLessEqual(counts[0], budget, "{} queries, the budget is {}".format(counts[0], budget))
+
+    def login(self):
+        return self.client.post("/api/token/", {"phone": self.user.phone, "password": PASSWORD}).json()
+
+    def auth(self):
+        return {"HTTP_AUTHORIZATION": "Bearer {}".format(self.login()["access"])}
+
+    def project(self):
+        return Project.objects.order_by("-id").first()
+
+    def project_data(self, files=()):
+        return {
+            "title": "New project", "description": "Landing page", "worker_type": "freelancer",
+            "project_category": ProjectCategory.objects.order_by("id").first().id,
+            "freelancer_category": FreelancerCategory.objects.order_by("id").first().id,
+            "price": 100, "deadline": "2030-01-01", "status": "published", "files": list(files),
+        }
+
+    def test_otp_create(self):
+        phones = iter(range(100))
+        self.assertQueryBudget(
+            4, lambda phone: self.client.post("/api/otp/", {"phone": phone}),
+            prepare=lambda: "99893{:07d}".format(next(phones)),
+        )
+
+    def test_otp_validate(self):
+        def prepare():
+            return Otp.objects.create(phone="998930000000")
+
+        self.assertQueryBudget(
+            2, lambda otp: self.client.post("/api/otp/{}/validate/".format(otp.id), {"code": otp.code}),
+            prepare=prepare,
+        )
+
+    def test_token(self):
+        self.assertQueryBudget(1, lambda: self.client.post(
+            "/api/token/", {"phone": self.user.phone, "password": PASSWORD}
+        ))
+
+    def test_token_refresh(self):
+        def prepare():
+            revocation_list._filter = None
+            revocation_list._checked = 0
+            return self.login()["refresh"]
+
+        self.assertQueryBudget(2, lambda refresh: self.client.post(
+            "/api/token/refresh/", {"refresh": refresh}
+        ), prepare=prepare)
+
+    def test_token_revoke(self):
+        self.assertQueryBudget(4, lambda refresh: self.client.post(
+            "/api/token/revoke/", {"refresh": refresh}
+        ), prepare=lambda: self.login()["refresh"])
+
+    def test_user_update(self):
+        self.assertQueryBudget(4, lambda: self.client.patch(
+            "/api/user/{}/".format(self.user.id), {"phone": self.user.phone}, content_type="application/json"
+        ))
+
+    def test_client_create(self):
+        phones = iter(range(100))
+        self.assertQueryBudget(5, lambda phone: self.client.post(
+            "/api/client/", {"fullname": "New", "user": {"phone": phone, "password": PASSWORD}},
+            content_type="application/json",
+        ), prepare=lambda: "99894{:07d}".format(next(phones)))
+
+    def test_client_retrieve(self):
+        self.assertQueryBudget(1, lambda: self.client.get("/api/client/{}/".format(self.client_obj.id)))
+
+    def test_client_update(self):
+        self.assertQueryBudget(2, lambda: self.client.patch(
+            "/api/client/{}/".format(self.client_obj.id), {"fullname": "Renamed"}, content_type="application/json"
+        ))
+
+    def test_individual_create(self):
+        def prepare():
+            user = User.objects.create(phone="99895{:07d}".format(User.objects.count()))
+            return Client.objects.create(user=user, fullname="New")
+
+        self.assertQueryBudget(4, lambda client: self.client.post("/api/individual/", {
+            "client": client.id, "fullname": "New", "passport_series": "AA", "passport_number": "1",
+            "passport_given_date": "2020-01-01", "passport_issued_address": "Tashkent", "country": "Uzbekistan",
+            "region": "Tashkent", "city": "Tashkent", "address": "Street 1",
+        }), prepare=prepare)
+
+    def test_individual_update(self):
+        self.assertQueryBudget(2, lambda: self.client.patch(
+            "/api/individual/{}/".format(self.individual.id), {"city": "Samarkand"}, content_type="application/json"
+        ))
+
+    def test_legal_entity_create(self):
+        self.assertQueryBudget(1, lambda: self.client.post("/api/legal-entity/", {
+            "fullname": "New", "company": "Company", "bank_name": "Bank", "bank_account": "1", "mfo": "1",
+            "inn": "1", "country": "Uzbekistan", "region": "Tashkent", "city": "Tashkent", "post_code": "100000",
+            "address": "Street 1", "telegram_phone": "998901234567", "email": "owner@example.com",
+        }))
+
+    def test_legal_entity_update(self):
+        self.assertQueryBudget(2, lambda: self.client.patch(
+            "/api/legal-entity/{}/".format(self.legal_entity.id), {"city": "Samarkand"},
+            content_type="application/json",
+        ))
+
+    def test_temp_file_create(self):
+        self.assertQueryBudget(4, lambda: self.client.post(
+            "/api/temp-file/", {"file": SimpleUploadedFile("brief.pdf", b"brief")}
+        ))
+
+    def test_temp_file_delete(self):
+        self.assertQueryBudget(5, lambda temp_file: self.client.delete(
+            "/api/temp-file/{}/".format(temp_file.id)
+        ), prepare=lambda: TempFile.objects.create(file=SimpleUploadedFile("brief.pdf", b"brief")))
+
+    def test_chunked_upload(self):
+        def upload():
+            return self.client.post("/api/chunked-upload/", {"filename": "brief.pdf", "size": 5}).json()["id"]
+
+        self.assertQueryBudget(1, lambda: self.client.post(
+            "/api/chunked-upload/", {"filename": "brief.pdf", "size": 5}
+        ))
+        self.assertQueryBudget(1, lambda pk: self.client.get("/api/chunked-upload/{}/".format(pk)), prepare=upload)
+        self.assertQueryBudget(5, lambda pk: self.client.patch(
+            "/api/chunked-upload/{}/".format(pk), b"brief",
+            content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET="0",
+        ), prepare=upload)
+
+        def received():
+            pk = upload()
+            self.client.patch(
+                "/api/chunked-upload/{}/".format(pk), b"brief",
+                content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET="0",
+            )
+            return pk
+
+        self.assertQueryBudget(9, lambda pk: self.client.post(
+            "/api/chunked-upload/{}/finalize/".format(pk)
+        ), prepare=received)
+        self.assertQueryBudget(3, lambda pk: self.client.delete("/api/chunked-upload/{}/".format(pk)), prepare=upload)
+
+    def test_category_lists(self):
+        for prefix in ("project-category", "freelancer-category"):
+            with self.subTest(prefix):
+                self.assertQueryBudget(2, lambda: self.client.get("/api/{}/".format(prefix)))
+                self.assertQueryBudget(2, lambda: self.client.get("/api/{}/tree/".format(prefix)))
+
+    def test_worker_types(self):
+        self.assertQueryBudget(0, lambda: self.client.get("/api/worker-type/"))
+
+    def test_project_list(self):
+        self.assertQueryBudget(4, lambda: self.client.get("/api/project/"))
+        self.assertQueryBudget(6, lambda: self.client.get("/api/project/", {
+            "status": "published", "tags": "python,django", "price_min": 50,
+            "project_category": ProjectCategory.objects.order_by("id").first().id,
+        }))
+
+    def test_project_retrieve(self):
+        self.assertQueryBudget(5, lambda: self.client.get("/api/project/{}/".format(self.project().id)))
+
+    def test_project_create(self):
+        def prepare():
+            return [TempFile.objects.create(file="blobs/00/00/attachment.pdf").id for _ in range(3)]
+
+        self.assertQueryBudget(23, lambda files: self.client.post(
+            "/api/project/", self.project_data(files), content_type="application/json", **self.auth()
+        ), prepare=prepare)
+
+    def test_project_delete(self):
+        self.assertQueryBudget(15, lambda: self.client.delete("/api/project/{}/".format(self.project().id)))
+
+    def test_project_search(self):
+        self.assertQueryBudget(5, lambda: self.client.get("/api/project/search/", {"q": "mobile app"}))
+
+    def test_project_facets(self):
+        self.assertQueryBudget(3, lambda: self.client.get("/api/project/facets/", {"status": "published"}))
+
+    def export(self, path, headers, **params):
+        response = self.client.get(path, params, **headers)
+        # Rows are read while the body streams
+        b"".join(response.streaming_content)
+        return response
+
+    def test_exports(self):
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertQueryBudget(2, lambda headers: self.export(
+            "/api/export/projects/", headers, status="published"
+        ), prepare=self.auth)
+        self.assertQueryBudget(3, lambda headers: self.export(
+            "/api/export/clients/", headers, output="csv", gzip="1"
+        ), prepare=self.auth)
+
+    def test_project_photo_variant(self):
+        def prepare():
+            photo = ProjectPhoto.objects.order_by("-id").first()
+            path = content_storage.path(variant_name(photo.photo.name, "thumbnail"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "wb").close()
+            return photo
+
+        self.assertQueryBudget(1, lambda photo: self.client.get(
+            "/api/project-photo/{}/variants/thumbnail/".format(photo.id)
+        ), prepare=prepare)
+
+
+class RecordingSmsBackend(BaseSmsBackend):
+    max_batch_size = 2
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.calls = []
+
+    def send_messages(self, messages):
+        self.calls.append([message.phone for message in messages])
+        if self.errors == "raise":
+            raise ConnectionError("gateway down")
+        return [self.errors.get(message.phone) for message in messages]
+
+
+@override_settings(
+    OTP_DISPATCH_IN_PROCESS=False, OTP_DISPATCH_BATCH_SIZE=3, OTP_DISPATCH_MAX_ATTEMPTS=3,
+    OTP_DISPATCH_BACKOFF=2, OTP_DISPATCH_MAX_BACKOFF=5, OTP_DISPATCH_LEASE=60,
+)
+class OtpDispatcherTests(TestCase):
+    def setUp(self):
+        self.dispatcher = OtpDispatcher()
+        self.backend = self.dispatcher._backend = RecordingSmsBackend()
+        for i in range(5):
+            OtpOutbox.objects.create(phone="99890000000{}".format(i), code="123456")
+
+    def test_claim_leases_a_batch(self):
+        rows = self.dispatcher.claim()
+        self.assertEqual(len(rows), 3)
+        lease = timezone.now() + timezone.timedelta(seconds=50)
+        for row in OtpOutbox.objects.filter(id__in=[row.id for row in rows]):
+            self.assertEqual(row.attempts, 1)
+            self.assertGreater(row.next_attempt_at, lease)
+        # Leased rows are not claimed twice
+        self.assertEqual(len(self.dispatcher.claim()), 2)
+        self.assertEqual(self.dispatcher.claim(), [])
+
+    def test_deliver_in_gateway_batches(self):
+        self.assertEqual(self.dispatcher.dispatch_once(), 3)
+        self.assertEqual([len(call) for call in self.backend.calls], [2, 1])
+        self.assertEqual(OtpOutbox.objects.filter(status=OtpOutbox.SENT, sent_at__isnull=False).count(), 3)
+        self.assertEqual(self.dispatcher.dispatch_once(), 2)
+        self.assertFalse(OtpOutbox.objects.exclude(status=OtpOutbox.SENT).exists())
+
+    def test_rejected_message_is_retried_with_backoff(self):
+        self.backend.errors = {"998900000000": "invalid number"}
+        self.dispatcher.dispatch_once()
+        row = OtpOutbox.objects.get(phone="998900000000")
+        self.assertEqual((row.status, row.last_error), (OtpOutbox.PENDING, "invalid number"))
+        self.assertAlmostEqual((row.next_attempt_at - timezone.now()).total_seconds(), 2, delta=1)
+        self.assertEqual(OtpOutbox.objects.filter(status=OtpOutbox.SENT).count(), 2)
+
+    def test_backoff_doubles_up_to_the_maximum(self):
+        self.assertEqual(
+            [self.dispatcher.backoff(attempts).total_seconds() for attempts in (1, 2, 3, 4)], [2, 4, 5, 5]
+        )
+
+    def test_failed_gateway_call_gives_up_after_max_attempts(self):
+        self.backend.errors = "raise"
+        with self.assertLogs("api.services", "ERROR"):
+            for attempt in range(3):
+                # Make the rows due again instead of waiting out the backoff
+                OtpOutbox.objects.update(next_attempt_at=timezone.now())
+                while self.dispatcher.dispatch_once():
+                    pass
+        self.assertEqual(OtpOutbox.objects.filter(status=OtpOutbox.FAILED, attempts=3).count(), 5)
+        self.assertEqual(OtpOutbox.objects.first().last_error, "gateway down")
+        OtpOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.dispatcher.claim(), [])
+
+    def test_stub_backend_fails_deploy_check_without_debug(self):
+        with override_settings(DEBUG=False, OTP_SMS_BACKEND="api.sms.StubSmsBackend"):
+            errors = check_sms_backend()
+        self.assertEqual([error.id for error in errors], ["api.E001"])
+
+
+@override_settings(OTP_DISPATCH_IN_PROCESS=False)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_forwarded_for_does_not_reset_the_ip_limit(self):
+        statuses = [
+            self.client.post(
+                "/api/otp/", {"phone": "99896{:07d}".format(i)}, HTTP_X_FORWARDED_FOR="10.0.0.{}".format(i)
+            ).status_code
+            for i in range(31)
+        ]
+        self.assertEqual(statuses.count(201), 30)
+        self.assertEqual(statuses[-1], 429)
+
+    def test_phone_limit_and_retry_after(self):
+        for i in range(3):
+            self.assertEqual(self.client.post("/api/otp/", {"phone": "998970000000"}).status_code, 201)
+        response = self.client.post("/api/otp/", {"phone": "+998 97 000 00 00"})
+        self.assertEqual(response.status_code, 429)
+        self.assertLessEqual(int(response["Retry-After"]), 60)
+
+
+@override_settings(OTP_DISPATCH_IN_PROCESS=False, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser(phone="998900000001", password=PASSWORD)
+        response = self.client.post("/api/token/", {"phone": self.user.phone, "password": PASSWORD})
+        self.headers = {"HTTP_AUTHORIZATION": "Bearer {}".format(response.json()["access"])}
+
+    def export(self):
+        return self.client.get("/api/export/projects/", **self.headers).status_code
+
+    def later(self):
+        # Tokens issued in the same second as the epoch stay valid
+        return mock.patch("api.authentication.time.time", return_value=time.time() + 1)
+
+    def test_saves_without_claim_changes_keep_the_session(self):
+        with self.later():
+            user = User.objects.get(pk=self.user.pk)
+            user.last_login = timezone.now()
+            user.save(update_fields=["last_login"])
+            user.save()
+        self.assertEqual(self.export(), 200)
+
+    def test_deactivation_ends_the_session(self):
+        with self.later():
+            user = User.objects.get(pk=self.user.pk)
+            user.is_active = False
+            user.save()
+        self.assertEqual(self.export(), 401)
+
+    def test_password_change_ends_the_session(self):
+        with self.later():
+            self.user.set_password("changed")
+            self.user.save()
+        self.assertEqual(self.export(), 401)
+
+    def test_losing_superuser_ends_the_session(self):
+        with self.later():
+            self.user.is_superuser = False
+            self.user.save()
+        self.assertEqual(self.export(), 401)
+
+    def test_inactive_claim_is_rejected(self):
+        self.user.is_active = False
+        token = ClaimsRefreshToken.for_user(self.user).access_token
+        response = self.client.get("/api/export/projects/", HTTP_AUTHORIZATION="Bearer {}".format(token))
+        self.assertEqual(response.status_code, 401)
+
+
+class ChunkedUploadTests(TemporaryMediaMixin, TestCase):
+    def test_racing_chunks_for_one_offset_do_not_mix(self):
+        upload = start_upload("brief.txt", 10)
+        winner = io.BytesIO(b"AAAAAAAAAA")
+
+        class Interrupted(io.BytesIO):
+            # Another request appends the same offset while this body streams in
+            def read(self, size=-1):
+                if not self.tell():
+                    self.result = append_chunk(upload.pk, 0, winner, 10)
+                return super().read(size)
+
+        loser = Interrupted(b"BBBBBBBBBB")
+        result, error = append_chunk(upload.pk, 0, loser, 10)
+        self.assertEqual(error, UPLOAD_OFFSET_MISMATCH)
+        self.assertIsNone(loser.result[1])
+        self.assertEqual(result.offset, 10)
+        with default_storage.open(upload.file.name) as f:
+            self.assertEqual(f.read(), b"AAAAAAAAAA")
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(upload.file.name))), ["brief.txt"])
+
+        upload, error = finish_upload(upload.pk, hashlib.sha256(b"AAAAAAAAAA").hexdigest())
+        self.assertIsNone(error)
+        self.assertEqual(upload.status, ChunkedUpload.COMPLETE)
+
+    def test_resume_after_dropped_connection(self):
+        upload = start_upload("brief.txt", 6)
+        upload, error = append_chunk(upload.pk, 0, io.BytesIO(b"abc"), 6)
+        self.assertEqual((upload.offset, error), (3, None))
+        upload, error = append_chunk(upload.pk, 3, io.BytesIO(b"def"), 3)
+        self.assertEqual((upload.offset, error), (6, None))
+        upload, error = finish_upload(upload.pk, hashlib.sha256(b"abcdef").hexdigest())
+        self.assertIsNone(error)
+
+
+@override_settings(OTP_DISPATCH_IN_PROCESS=False, PHOTO_VARIANTS_ON_SAVE=False)
+class BlobTests(TemporaryMediaMixin, TestCase):
+    def upload(self, content=b"brief"):
+        return TempFile.objects.create(file=SimpleUploadedFile("brief.pdf", content))
+
+    def age(self, name):
+        # Pretend the file was written before the grace period
+        past = time.time() - 3600
+        os.utime(content_storage.path(name), (past, past))
+
+    def delete(self, instance):
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.delete()
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self.upload(), self.upload()
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get(name=first.file.name).references, 2)
+        self.assertNotEqual(self.upload(b"other").file.name, first.file.name)
+
+    def test_file_is_deleted_with_its_last_reference(self):
+        first, second = self.upload(), self.upload()
+        name = first.file.name
+        self.age(name)
+        self.delete(first)
+        self.assertEqual(Blob.objects.get(name=name).references, 1)
+        self.assertTrue(content_storage.exists(name))
+        self.delete(second)
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertFalse(content_storage.exists(name))
+
+    def test_fresh_file_is_kept_within_the_grace_period(self):
+        temp_file = self.upload()
+        name = temp_file.file.name
+        self.delete(temp_file)
+        self.assertEqual(Blob.objects.get(name=name).references, 0)
+        self.assertTrue(content_storage.exists(name))
+        # A later pass deletes it once the grace period is over
+        self.age(name)
+        self.assertEqual(delete_unreferenced([name]), len(b"brief"))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertFalse(content_storage.exists(name))
+
+    def test_reupload_before_the_pass_keeps_the_file(self):
+        temp_file = self.upload()
+        name = temp_file.file.name
+        self.age(name)
+        with self.captureOnCommitCallbacks() as callbacks:
+            temp_file.delete()
+        again = self.upload()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Blob.objects.get(name=name).references, 1)
+        self.assertTrue(content_storage.exists(again.file.name))
+
+    def test_promotion_to_project_file_keeps_the_reference(self):
+        temp_file = self.upload()
+        name = temp_file.file.name
+        self.age(name)
+        serializer = ProjectCreateUpdateSerializer(data={
+            "title": "New project", "description": "Landing page", "worker_type": "freelancer",
+            "project_category": ProjectCategory.objects.create(slug="web", title="Web").id,
+            "freelancer_category": FreelancerCategory.objects.create(slug="dev", title="Dev").id,
+            "price": 100, "deadline": "2030-01-01", "status": "published", "files": [temp_file.id],
+        })
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            project = serializer.save()
+        self.assertEqual(project.files.get().file.name, name)
+        self.assertFalse(TempFile.objects.exists())
+        self.assertEqual(Blob.objects.get(name=name).references, 1)
+        self.assertTrue(content_storage.exists(name))
+
+
+@override_settings(OTP_DISPATCH_IN_PROCESS=False, PHOTO_VARIANTS_ON_SAVE=False)
+class PhotoVariantTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.create(
+            title="Project", description="Photos", worker_type="freelancer", price=100, deadline="2030-01-01",
+        )
+
+    def photo(self, content):
+        return ProjectPhoto.objects.create(project=self.project, photo=SimpleUploadedFile("photo.jpg", content))
+
+    def variant(self, photo):
+        return self.client.get("/api/project-photo/{}/variants/thumbnail/".format(photo.id))
+
+    def test_unreadable_photo(self):
+        response = self.variant(self.photo(b"not an image"))
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(response.json()["detail"], PHOTO_UNREADABLE)
+
+    def test_rendering_timeout(self):
+        photo = self.photo(b"slow")
+        with mock.patch.object(variant_pool, "submit", return_value=Future()):
+            with override_settings(PHOTO_VARIANT_TIMEOUT=0):
+                response = self.variant(photo)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+
+    def test_dead_worker(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool("killed"))
+        with mock.patch.object(variant_pool, "submit", return_value=future):
+            response = self.variant(self.photo(b"huge"))
+        self.assertEqual(response.status_code, 503)
+
+    def test_missing_photo(self):
+        photo = self.photo(b"gone")
+        os.remove(content_storage.path(photo.photo.name))
+        self.assertEqual(self.variant(photo).status_code, 404)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_not_served_without_a_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"metrics_sample_rate", response.content)
+
+
+class IndexAdvisorTests(SimpleTestCase):
+    def test_equality_columns_come_first_then_the_range(self):
+        sql = (
+            'SELECT "api_project"."id" FROM "api_project" WHERE ("api_project"."price" >= %s '
+            'AND "api_project"."status" = %s AND "api_project"."worker_type" IN (%s, %s)) LIMIT 21'
+        )
+        self.assertEqual(candidate_indexes(sql), {"api_project": (("status", "worker_type", "price"), 2)})
+
+    def test_sort_columns_follow_the_equality_columns(self):
+        sql = (
+            'SELECT "api_project"."id" FROM "api_project" WHERE "api_project"."status" = %s '
+            'ORDER BY "api_project"."created_at" DESC, "api_project"."id" DESC LIMIT 21'
+        )
+        self.assertEqual(candidate_indexes(sql), {"api_project": (("status", "created_at", "id"), 1)})
+
+    def test_range_wins_over_sorting(self):
+        sql = (
+            'SELECT "api_otp"."id" FROM "api_otp" WHERE "api_otp"."expires_in" < %s '
+            'ORDER BY "api_otp"."phone" ASC'
+        )
+        self.assertEqual(candidate_indexes(sql), {"api_otp": (("expires_in",), 0)})
+
+    def test_subquery_in_the_select_list_is_not_the_where_clause(self):
+        sql = (
+            'SELECT "api_project"."id", (SELECT COUNT(*) FROM "api_projectfile" U0 '
+            'WHERE U0."project_id" = "api_project"."id" ORDER BY U0."id" LIMIT 1) AS "files" '
+            'FROM "api_project" WHERE "api_project"."status" = %s ORDER BY "api_project"."price" ASC LIMIT 10'
+        )
+        where, order = split_clauses(sql)
+        self.assertEqual(where.strip(), '"api_project"."status" = %s')
+        self.assertEqual(order.strip(), '"api_project"."price" ASC')
+        self.assertEqual(candidate_indexes(sql), {"api_project": (("status", "price"), 1)})
+
+    def test_subquery_in_the_where_clause_keeps_its_own_table(self):
+        sql = (
+            'SELECT "api_project"."id" FROM "api_project" WHERE "api_project"."client_id" IN '
+            '(SELECT V0."id" FROM "api_client" V0 WHERE "api_client"."client_type" = %s LIMIT 5) '
+            'AND "api_project"."status" = %s'
+        )
+        where, order = split_clauses(sql)
+        self.assertTrue(where.endswith('"api_project"."status" = %s'))
+        self.assertEqual(order, "")
+        self.assertEqual(candidate_indexes(sql), {
+            "api_project": (("client_id", "status"), 2),
+            "api_client": (("client_type",), 1),
+        })
+
+    def test_keywords_in_literals_are_ignored(self):
+        sql = 'SELECT "api_tag"."id" FROM "api_tag" WHERE "api_tag"."name" = \' ORDER BY \' LIMIT 1'
+        self.assertEqual(split_clauses(sql), ('"api_tag"."name" = \' ORDER BY \' ', ""))
+
+    def test_equality_columns_are_covered_in_any_order(self):
+        indexes = [["worker_type", "status"]]
+        self.assertTrue(is_covered(("status", "worker_type"), 2, indexes, ordered=False))
+        self.assertFalse(is_covered(("status", "worker_type"), 2, [["status"]], ordered=False))
+
+    def test_range_needs_the_leading_column(self):
+        self.assertTrue(is_covered(("price",), 0, [["price", "status"]], ordered=False))
+        self.assertFalse(is_covered(("price",), 0, [["status", "price"]], ordered=False))
+
+    def test_sorted_plans_need_the_sort_columns_in_the_index(self):
+        columns = ("status", "created_at")
+        self.assertTrue(is_covered(columns, 1, [["status"]], ordered=False))
+        self.assertFalse(is_covered(columns, 1, [["status"]], ordered=True))
+        self.assertTrue(is_covered(columns, 1, [["status", "created_at", "id"]], ordered=True))
+
+
+@override_settings(OTP_DISPATCH_IN_PROCESS=False, EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create(phone="998900000001", is_superuser=True))
+        user = User.objects.create(phone="998900000002")
+        self.owner = Client.objects.create(user=user, fullname="=HYPERLINK(\"http://x\")", client_type=INDIVIDUAL)
+        Individual.objects.create(
+            client=self.owner, fullname="Owner", passport_series="AA", passport_number="1",
+            passport_given_date="2020-01-01", passport_issued_address="Tashkent", country="Uzbekistan",
+            region="Tashkent", city="Tashkent", address="@SUM(A1)",
+        )
+        for i in range(3):
+            project = Project.objects.create(
+                client=self.owner, title="Project {}".format(i), description="-2+3" if i == 0 else "Landing page",
+                worker_type="freelancer", price=100 + i, deadline="2030-01-01", status="published",
+            )
+            project.tags.add("python", "design")
+
+    def export(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_signed_up_users_are_forbidden(self):
+        self.client.logout()
+        user = User.objects.create_user(phone="998900000003", password=PASSWORD)
+        access = self.client.post("/api/token/", {"phone": user.phone, "password": PASSWORD}).json()["access"]
+        for path in ("/api/export/projects/", "/api/export/clients/"):
+            response = self.client.get(path, HTTP_AUTHORIZATION="Bearer {}".format(access))
+            self.assertEqual(response.status_code, 403)
+
+    def test_projects_as_ndjson(self):
+        response, body = self.export("/api/export/projects/")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row["title"] for row in rows], ["Project 0", "Project 1", "Project 2"])
+        self.assertEqual(rows[0]["tags"], ["design", "python"])
+        self.assertEqual(rows[0]["client_id"], self.owner.id)
+        self.assertEqual(rows[0]["description"], "-2+3")
+
+    def test_clients_as_csv(self):
+        response, body = self.export("/api/export/clients/", output="csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        (owner,) = csv.DictReader(io.StringIO(body.decode()))
+        self.assertEqual(owner["id"], str(self.owner.id))
+        self.assertEqual(owner["phone"], "998900000002")
+        self.assertEqual(owner["individual.passport_series"], "AA")
+        self.assertEqual(owner["legal_entity.company"], "")
+
+    def test_formulas_are_escaped_in_csv(self):
+        _, body = self.export("/api/export/clients/", output="csv")
+        (owner,) = csv.DictReader(io.StringIO(body.decode()))
+        self.assertEqual(owner["fullname"], "'=HYPERLINK(\"http://x\")")
+        self.assertEqual(owner["individual.address"], "'@SUM(A1)")
+        _, body = self.export("/api/export/projects/", output="csv")
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0]["description"], "'-2+3")
+        self.assertEqual(rows[0]["tags"], "design,python")
+
+    def test_gzip(self):
+        response, body = self.export("/api/export/projects/", output="csv", gzip="1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual(lines[0].split(","), PROJECT_FIELDS + ["tags"])
+        self.assertEqual(len(lines), 4)
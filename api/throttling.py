@@ -0,0 +1,99 @@
+import time
+
+from django.core.cache import cache as default_cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from api.utils import clean_phone
+
+
+class FixedWindowThrottle(BaseThrottle):
+    """
+    Counts requests per fixed window in the cache. The rate "N/period"
+    allows N requests in every period, counted with the atomic cache.add()
+    and cache.incr(), so concurrent requests cannot share a slot.
+
+    The counters have to live in a cache shared by every worker (CACHE_URL
+    pointing at Redis or Memcached), the default locmem cache only limits
+    each process on its own.
+
+    The scope is built from the view action, e.g. "otp_create_phone", and
+    actions without a configured rate are not throttled.
+    """
+    cache = default_cache
+    timer = time.time
+    cache_format = "throttle_{scope}_{ident}_{window}"
+    kind = None
+    durations = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+    def get_scope(self, view):
+        return "{}_{}_{}".format(view.basename, view.action, self.kind)
+
+    def get_ident_value(self, request, view):
+        raise NotImplementedError(".get_ident_value() must be overridden")
+
+    def parse_rate(self, rate):
+        try:
+            num, period = rate.split("/")
+            return int(num), self.durations[period[0]]
+        except (ValueError, KeyError):
+            raise ImproperlyConfigured("Invalid throttle rate '{}'".format(rate))
+
+    def allow_request(self, request, view):
+        self.wait_time = None
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.get_scope(view))
+        if rate is None:
+            return True
+        ident = self.get_ident_value(request, view)
+        if not ident:
+            return True
+
+        limit, duration = self.parse_rate(rate)
+        now = self.timer()
+        window = int(now // duration)
+        key = self.cache_format.format(scope=self.get_scope(view), ident=ident, window=window)
+        if self.cache.add(key, 1, duration):
+            return True
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # The counter expired between add() and incr()
+            self.cache.add(key, 1, duration)
+            return True
+        if count > limit:
+            self.wait_time = (window + 1) * duration - now
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+class PhoneRateThrottle(FixedWindowThrottle):
+    kind = "phone"
+
+    def get_ident_value(self, request, view):
+        phone = request.data.get("phone")
+        if not isinstance(phone, str):
+            return None
+        return clean_phone(phone)
+
+
+class IpRateThrottle(FixedWindowThrottle):
+    kind = "ip"
+
+    def get_ident_value(self, request, view):
+        # X-Forwarded-For is only trusted for REST_FRAMEWORK["NUM_PROXIES"] hops,
+        # with none configured this is REMOTE_ADDR
+        return self.get_ident(request)
+
+
+class ObjectRateThrottle(FixedWindowThrottle):
+    """
+    Throttles attempts against a single object, e.g. guesses of one OTP code.
+    """
+    kind = "object"
+
+    def get_ident_value(self, request, view):
+        return view.kwargs.get(view.lookup_url_kwarg or view.lookup_field)
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from mptt.utils import get_cached_trees
+from parler import appsettings
+
+
+VERSION_KEY = "category-tree:{model}:version"
+TREE_KEY = "category-tree:{model}:{version}:{language}"
+TREE_TIMEOUT = 60 * 60 * 24
+
+
+def tree_version(model):
+    key = VERSION_KEY.format(model=model._meta.label_lower)
+    version = cache.get(key)
+    if version is None:
+        # A random version can not collide with trees cached before an eviction
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_tree(model):
+    cache.set(VERSION_KEY.format(model=model._meta.label_lower), uuid.uuid4().hex, None)
+
+
+def translated_title(node, languages):
+    translations = {t.language_code: t.title for t in node.translations.all()}
+    for language in languages:
+        if language in translations:
+            return translations[language]
+    return next(iter(translations.values()), "")
+
+
+def build_tree(model, language):
+    languages = appsettings.PARLER_LANGUAGES.get_active_choices(language)
+    nodes = model.objects.order_by("tree_id", "lft").prefetch_related("translations")
+
+    def serialize(node):
+        return {
+            "id": node.id,
+            "slug": node.slug,
+            "title": translated_title(node, languages),
+            "children": [serialize(child) for child in node.get_children()],
+        }
+
+    return [serialize(root) for root in get_cached_trees(nodes)]
+
+
+def get_tree(model, language):
+    """
+    Returns (etag, body) of the rendered tree for a language, built once per
+    tree version and served from the cache afterwards.
+    """
+    key = TREE_KEY.format(model=model._meta.label_lower, version=tree_version(model), language=language)
+    cached = cache.get(key)
+    if cached is None:
+        body = json.dumps(build_tree(model, language), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        cached = ('"{}"'.format(hashlib.sha256(body).hexdigest()[:32]), body)
+        cache.set(key, cached, TREE_TIMEOUT)
+    return cached
+
+
+def invalidate_category_tree(sender, **kwargs):
+    if not hasattr(sender, "_parler_meta"):
+        # A translation row changed, invalidate the tree of its category
+        sender = sender._meta.get_field("master").related_model
+    invalidate_tree(sender)
+
+
+def connect_tree_signals(*models):
+    from django.db.models.signals import post_delete, post_save
+    from mptt.signals import node_moved
+
+    for model in models:
+        for sender in (model, model._parler_meta.root_model):
+            post_save.connect(invalidate_category_tree, sender=sender)
+            post_delete.connect(invalidate_category_tree, sender=sender)
+        node_moved.connect(invalidate_category_tree, sender=model)
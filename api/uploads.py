@@ -0,0 +1,167 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from api.errors_details import *
+from api.models import ChunkedUpload, TempFile
+from api.storage import content_storage
+
+
+READ_SIZE = 64 * 1024
+
+
+class RunningHashes:
+    """
+    SHA-256 state of uploads appended to by this process, keyed by upload
+    id together with the offset it covers. hashlib state can not be stored,
+    so an upload continued by another process is hashed from disk instead.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._hashes = OrderedDict()
+
+    def take(self, pk, offset):
+        with self._lock:
+            entry = self._hashes.pop(pk, None)
+        if entry is None:
+            return hashlib.sha256() if offset == 0 else None
+        hashed, sha = entry
+        return sha if hashed == offset else None
+
+    def put(self, pk, offset, sha):
+        with self._lock:
+            self._hashes[pk] = (offset, sha)
+            while len(self._hashes) > self.limit:
+                self._hashes.popitem(last=False)
+
+
+running_hashes = RunningHashes(settings.UPLOAD_RUNNING_HASHES)
+
+
+def start_upload(filename, size):
+    upload = ChunkedUpload(filename=filename, size=size)
+    # The chunks are written straight into the file the TempFile will use
+    name = "files/temp/{}/{}".format(upload.id.hex, filename)
+    max_length = TempFile._meta.get_field("file").max_length
+    upload.file.name = default_storage.save(name, ContentFile(b""), max_length=max_length)
+    upload.save()
+    return upload
+
+
+def append_chunk(pk, offset, stream, length):
+    """
+    Writes `length` bytes from `stream` at `offset`. Returns (upload, error).
+    Bytes received before a dropped connection are kept, the client resumes
+    from the offset stored on the upload.
+    """
+    upload = ChunkedUpload.objects.get(pk=pk)
+    if upload.status != ChunkedUpload.UPLOADING:
+        return upload, UPLOAD_ALREADY_COMPLETE
+    if offset != upload.offset:
+        return upload, UPLOAD_OFFSET_MISMATCH
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE or offset + length > upload.size:
+        return upload, UPLOAD_TOO_LARGE
+
+    # The body streams into a part file while no lock is held. Only the
+    # request that advances the offset appends it, under the row lock the
+    # update takes, so concurrent or retried chunks never mix in the file.
+    path = default_storage.path(upload.file.name)
+    sha = running_hashes.take(upload.pk, offset)
+    descriptor, part = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".partial-")
+    try:
+        written = 0
+        with os.fdopen(descriptor, "wb") as destination:
+            try:
+                while written < length:
+                    data = stream.read(min(READ_SIZE, length - written))
+                    if not data:
+                        break
+                    destination.write(data)
+                    if sha is not None:
+                        sha.update(data)
+                    written += len(data)
+            except OSError:
+                # The client went away, keep what arrived
+                pass
+
+        with transaction.atomic():
+            updated = ChunkedUpload.objects.filter(pk=upload.pk, offset=offset, status=ChunkedUpload.UPLOADING) \
+                .update(offset=offset + written, updated_at=timezone.now())
+            if not updated:
+                return ChunkedUpload.objects.get(pk=pk), UPLOAD_OFFSET_MISMATCH
+            with open(part, "rb") as source, open(path, "r+b") as destination:
+                destination.seek(offset)
+                shutil.copyfileobj(source, destination, READ_SIZE)
+    finally:
+        os.remove(part)
+
+    upload.offset = offset + written
+    if sha is not None:
+        running_hashes.put(upload.pk, upload.offset, sha)
+    return upload, None
+
+
+def file_sha256(name):
+    sha = hashlib.sha256()
+    with default_storage.open(name, "rb") as source:
+        for data in iter(lambda: source.read(READ_SIZE), b""):
+            sha.update(data)
+    return sha
+
+
+def finish_upload(pk, checksum=None):
+    """
+    Turns a fully received upload into a TempFile. Returns (upload, error).
+    """
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().get(pk=pk)
+        if upload.status != ChunkedUpload.UPLOADING:
+            return upload, UPLOAD_ALREADY_COMPLETE
+        if upload.offset != upload.size:
+            return upload, UPLOAD_INCOMPLETE
+
+        sha = running_hashes.take(upload.pk, upload.offset) or file_sha256(upload.file.name)
+        digest = sha.hexdigest()
+        if checksum and checksum.lower() != digest:
+            running_hashes.put(upload.pk, upload.offset, sha)
+            return upload, UPLOAD_CHECKSUM_MISMATCH
+
+        # Moving the received file into blob storage is a rename
+        partial = default_storage.path(upload.file.name)
+        upload.file.name = content_storage.adopt(partial, digest, os.path.splitext(upload.filename)[1])
+        remove_upload_directory(partial)
+        upload.temp_file = TempFile.objects.create(file=upload.file.name)
+        upload.sha256 = digest
+        upload.status = ChunkedUpload.COMPLETE
+        upload.save(update_fields=["file", "temp_file", "sha256", "status", "updated_at"])
+    return upload, None
+
+
+def remove_upload_directory(path):
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+
+def abort_upload(upload):
+    if upload.status == ChunkedUpload.UPLOADING:
+        name = upload.file.name
+
+        def delete_partial():
+            default_storage.delete(name)
+            remove_upload_directory(default_storage.path(name))
+
+        transaction.on_commit(delete_partial)
+    upload.delete()
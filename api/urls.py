@@ -1,6 +1,5 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import *
 
@@ -12,15 +11,20 @@ router.register("client", ClientViewSet, basename="client")
 router.register("individual", IndividualViewSet, basename="individual")
 router.register("legal-entity", LegalEntityViewSet, basename="legal-entity")
 router.register("temp-file", TempFileCreateDeleteViewSet, basename="temp-file")
+router.register("chunked-upload", ChunkedUploadViewSet, basename="chunked-upload")
 router.register("project-category", ProjectCategoryListViewSet, basename="project-category")
 router.register("freelancer-category", FreelancerCategoryListViewSet, basename="freelancer-category")
 router.register("worker-type", WorkerTypeListViewSet, basename="worker-type")
 router.register("project", ProjectCreateUpdateViewSet, basename="project")
+router.register("project-photo", ProjectPhotoViewSet, basename="project-photo")
 
 
 urlpatterns = [
     path("token/", JwtTokenApiView.as_view()),
-    path("token/refresh/", TokenRefreshView.as_view()),
+    path("token/refresh/", JwtTokenRefreshApiView.as_view()),
+    path("token/revoke/", JwtTokenRevokeApiView.as_view()),
+    path("export/projects/", ProjectExportView.as_view(), name="export-projects"),
+    path("export/clients/", ClientExportView.as_view(), name="export-clients"),
     
     path("", include(router.urls))
 ]
\ No newline at end of file
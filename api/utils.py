@@ -1,3 +1,6 @@
+import os
+
+
 def generate_code(length=5):
     return "11111"
     from random import randint
@@ -10,4 +13,15 @@ def clean_phone(phone):
         .replace(" ", "") \
         .replace("+", "") \
         .replace("-", "") \
-        .replace(".", "")
\ No newline at end of file
+        .replace(".", "")
+
+
+def open_private(path, mode="w"):
+    """
+    Opens a file for writing that only the user running the server can read,
+    also when it already existed with wider permissions.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if "a" in mode else os.O_TRUNC)
+    descriptor = os.open(path, flags, 0o600)
+    os.fchmod(descriptor, 0o600)
+    return os.fdopen(descriptor, mode)
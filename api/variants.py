@@ -0,0 +1,177 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import transaction
+
+from api.storage import content_storage
+
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadablePhoto(Exception):
+    pass
+
+
+class VariantUnavailable(Exception):
+    """
+    The variant could not be rendered in time, retrying later may work.
+    """
+
+
+def variant_name(name, variant):
+    root, _ = os.path.splitext(name)
+    return "{}.{}.jpg".format(root, variant)
+
+
+def variant_names(name):
+    return [variant_name(name, variant) for variant in settings.PHOTO_VARIANTS]
+
+
+def render_variant(source, target, size, crop, quality):
+    """
+    Writes a JPEG rendition of the image at `source` to `target`. Runs in
+    the worker processes, so it only touches files. The result is renamed
+    into place, rendering the same variant twice is harmless.
+    """
+    from PIL import Image, ImageOps
+
+    # Pillow 9.1 moved the filters to Image.Resampling
+    lanczos = getattr(Image, "Resampling", Image).LANCZOS
+    with Image.open(source) as image:
+        # Lets the JPEG decoder skip detail the rendition does not need
+        image.draft("RGB", size)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        if crop:
+            image = ImageOps.fit(image, size, lanczos)
+        else:
+            image.thumbnail(size, lanczos)
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".partial-")
+        try:
+            with os.fdopen(descriptor, "wb") as destination:
+                image.save(destination, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(partial, target)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+    return target
+
+
+class VariantPool:
+    """
+    Renders photo variants in a process pool so resizing neither holds the
+    GIL of request threads nor competes with them for a core.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.PHOTO_VARIANT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def submit(self, name, variant, force=False):
+        """
+        Schedules one variant of the stored photo `name` and returns a future,
+        or None when the variant already exists.
+        """
+        spec = settings.PHOTO_VARIANTS[variant]
+        target = content_storage.path(variant_name(name, variant))
+        if not force and os.path.exists(target):
+            return None
+        arguments = (content_storage.path(name), target, tuple(spec["size"]), spec["crop"], spec["quality"])
+        try:
+            return self.executor.submit(render_variant, *arguments)
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for memory on a huge image
+            self.reset()
+            return self.executor.submit(render_variant, *arguments)
+
+    def submit_all(self, name, force=False):
+        futures = [self.submit(name, variant, force) for variant in settings.PHOTO_VARIANTS]
+        return [future for future in futures if future is not None]
+
+    def ensure(self, name, variant):
+        """
+        Returns the storage name of the variant, rendering it first if it is
+        missing. Raises FileNotFoundError when the photo is gone,
+        UnreadablePhoto when it is not an image Pillow can safely decode and
+        VariantUnavailable when rendering timed out or its worker died.
+        """
+        from PIL import Image, UnidentifiedImageError
+
+        future = self.submit(name, variant)
+        if future is not None:
+            try:
+                future.result(timeout=settings.PHOTO_VARIANT_TIMEOUT)
+            except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+                raise UnreadablePhoto(str(e)) from e
+            except TimeoutError as e:
+                raise VariantUnavailable("Rendering took longer than PHOTO_VARIANT_TIMEOUT") from e
+            except BrokenProcessPool as e:
+                self.reset()
+                raise VariantUnavailable("A rendering worker died") from e
+        return variant_name(name, variant)
+
+
+variant_pool = VariantPool()
+
+
+def rendered_variant(name, variant):
+    """
+    Storage name of the variant if it has been rendered, otherwise None.
+    """
+    rendered = variant_name(name, variant)
+    return rendered if os.path.exists(content_storage.path(rendered)) else None
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error("Rendering a photo variant failed", exc_info=future.exception())
+
+
+def render_saved_photo(sender, instance, **kwargs):
+    name = instance.photo.name
+    if not name or not settings.PHOTO_VARIANTS_ON_SAVE:
+        return
+
+    def submit():
+        for future in variant_pool.submit_all(name):
+            future.add_done_callback(log_failure)
+
+    transaction.on_commit(submit)
+
+
+def connect_variant_signals(model):
+    from django.db.models.signals import post_save
+
+    post_save.connect(render_saved_photo, sender=model)
@@ -1,17 +1,39 @@
 from rest_framework.viewsets import mixins, GenericViewSet, ModelViewSet
 from rest_framework.decorators import action
+from django.conf import settings
+from django.db.models import Count, F
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import get_language
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
+    TokenRefreshView,
+    TokenViewBase,
 )
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from api.serializers import *
+from api.authentication import ClaimsRefreshToken
 from api.errors_details import *
+from api.exports import FORMATS, export_stream
+from api.filters import ProjectFilter
+from api.metrics import metrics_store
+from api.mixins import CategoryTreeMixin
+from api.otp_store import get_otp_store
+from api.pagination import ProjectCursorPagination
+from api.permissions import IsSuperUser
+from api.passwords import PasswordCheckBusy, password_check_pool
+from api.search import get_project_search
+from api.throttling import IpRateThrottle, ObjectRateThrottle, PhoneRateThrottle
+from api.uploads import abort_upload, append_chunk, finish_upload, start_upload
+from api.variants import UnreadablePhoto, VariantUnavailable, variant_pool
 
 
 class OtpViewSet(
@@ -20,8 +42,14 @@ class OtpViewSet(
     ):
     queryset = Otp.objects.all()
     serializer_class = OtpSerializer
+    throttle_classes = [PhoneRateThrottle, IpRateThrottle, ObjectRateThrottle]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        otp = get_otp_store().create(serializer.validated_data["phone"])
+        return Response(self.get_serializer(otp).data, status=status.HTTP_201_CREATED)
 
-    
     @swagger_auto_schema(
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
@@ -33,26 +61,15 @@ class OtpViewSet(
     @action(detail=True, methods=["post"], url_path="validate")
     def validate(self, request, pk=None):
         try:
-            otp = Otp.objects.get(id=pk)
-            now = timezone.now()
-            if otp.is_expired(now):
-                return Response(
-                    {
-                        "status": False,
-                        "detail": OTP_EXPIRED
-                    },
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            if not otp.check_code(request.data["code"]):
+            error = get_otp_store().validate(pk, request.data["code"])
+            if error:
                 return Response(
                     {
                         "status": False,
-                        "detail": WRONG_OTP_CODE
+                        "detail": error
                     },
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            otp.activate()
-            otp.save()
             return Response(
                 {
                     "status": True
@@ -95,23 +112,34 @@ class JwtTokenApiView(TokenObtainPairView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         data = serializer.validated_data
 
-        user = User.objects.filter(phone=data["phone"])
-        if not user.exists():
+        user = User.objects.select_related("client__individual", "client__legal_entity") \
+            .filter(phone=data["phone"]).first()
+        if user is None:
             return Response(
                 {
                     "status": False,
                     "detail": USER_DOES_NOT_EXIST
                 }
             )
-        user = user.first()
-        if not user.check_password(data["password"]):
+        try:
+            valid = password_check_pool.check(user, data["password"])
+        except PasswordCheckBusy:
+            return Response(
+                {
+                    "status": False,
+                    "detail": LOGIN_BUSY
+                },
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"}
+            )
+        if not valid:
             return Response(
                 {
                     "status": False,
                     "detail": INCORRECT_PASSWORD
                 }
             )
-        token = RefreshToken.for_user(user)
+        token = ClaimsRefreshToken.for_user(user)
         result = {
             "status": True,
             "access": str(token.access_token),
@@ -127,17 +155,25 @@ class JwtTokenApiView(TokenObtainPairView):
         return Response(result, status=status.HTTP_200_OK)
 
 
+class JwtTokenRefreshApiView(TokenRefreshView):
+    serializer_class = RevocableTokenRefreshSerializer
+
+
+class JwtTokenRevokeApiView(TokenViewBase):
+    serializer_class = TokenRevokeSerializer
+
+
 class ClientViewSet(
         mixins.CreateModelMixin,
         mixins.UpdateModelMixin,
         mixins.RetrieveModelMixin,
         GenericViewSet
     ):
-    queryset = Client.objects.all()
+    queryset = Client.objects.with_details()
     serializer_class = ClientCreateSerializer
     
-    def get_serializer(self, *args, **kwargs):
-        if self.action in ["list", "retrive"]:
+    def get_serializer_class(self):
+        if self.action in ["list", "retrieve"]:
             return ClientGetSerializer
         elif self.action in ["update", "partial_update"]:
             return ClientUpdateSerializer
@@ -146,8 +182,6 @@ class ClientViewSet(
     def get_queryset(self):
         if getattr(self, "swagger_fake_view", False):
             return Client.objects.none()
-        else:
-            print("hi")
         return super().get_queryset()
 
 
@@ -200,19 +234,127 @@ class TempFileCreateDeleteViewSet(
     serializer_class = TempFileSerializer
 
 
+class ChunkedUploadViewSet(
+        mixins.CreateModelMixin,
+        mixins.RetrieveModelMixin,
+        mixins.DestroyModelMixin,
+        GenericViewSet
+    ):
+    """
+    Resumable upload: create it with the file name and size, PATCH raw
+    chunks with an Upload-Offset header, then finalize it into a TempFile.
+    GET or HEAD reports the offset to resume from.
+    """
+    queryset = ChunkedUpload.objects.select_related("temp_file")
+    serializer_class = ChunkedUploadSerializer
+
+    def upload_response(self, upload, error=None, status_code=status.HTTP_200_OK):
+        if error:
+            data = {
+                "status": False,
+                "detail": error,
+                "offset": upload.offset
+            }
+        else:
+            data = self.get_serializer(upload).data
+        return Response(data, status=status_code, headers={"Upload-Offset": str(upload.offset)})
+
+    def perform_create(self, serializer):
+        serializer.instance = start_upload(**serializer.validated_data)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.upload_response(self.get_object())
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter("Upload-Offset", openapi.IN_HEADER, type=openapi.TYPE_INTEGER, required=True),
+        ],
+        request_body=openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_BINARY),
+    )
+    def partial_update(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers.get("Content-Length") or 0)
+        except (KeyError, ValueError):
+            return self.upload_response(upload, UPLOAD_OFFSET_MISMATCH, status.HTTP_400_BAD_REQUEST)
+
+        upload, error = append_chunk(upload.pk, offset, request.stream, length)
+        if error == UPLOAD_TOO_LARGE:
+            return self.upload_response(upload, error, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if error:
+            return self.upload_response(upload, error, status.HTTP_409_CONFLICT)
+        return self.upload_response(upload)
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                "sha256": openapi.Schema(type=openapi.TYPE_STRING, description="Expected checksum, optional"),
+            }
+        )
+    )
+    @action(detail=True, methods=["post"], url_path="finalize")
+    def finalize(self, request, pk=None):
+        upload, error = finish_upload(self.get_object().pk, request.data.get("sha256"))
+        if error == UPLOAD_ALREADY_COMPLETE:
+            return self.upload_response(upload, error, status.HTTP_409_CONFLICT)
+        if error:
+            return self.upload_response(upload, error, status.HTTP_400_BAD_REQUEST)
+        return self.upload_response(upload)
+
+    def perform_destroy(self, instance):
+        abort_upload(instance)
+
+
+class ProjectPhotoViewSet(GenericViewSet):
+    queryset = ProjectPhoto.objects.all()
+    serializer_class = ProjectPhotoSerializer
+
+    @action(detail=True, methods=["get"], url_path=r"variants/(?P<variant>[a-z0-9_-]+)")
+    def variant(self, request, pk=None, variant=None):
+        if variant not in settings.PHOTO_VARIANTS:
+            raise Http404
+        photo = self.get_object()
+        try:
+            name = variant_pool.ensure(photo.photo.name, variant)
+        except FileNotFoundError:
+            raise Http404
+        except UnreadablePhoto:
+            return Response(
+                {
+                    "status": False,
+                    "detail": PHOTO_UNREADABLE
+                },
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        except VariantUnavailable:
+            return Response(
+                {
+                    "status": False,
+                    "detail": PHOTO_VARIANT_UNAVAILABLE
+                },
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "5"}
+            )
+        return HttpResponseRedirect(photo.photo.storage.url(name))
+
+
 class ProjectCategoryListViewSet(
+        CategoryTreeMixin,
         mixins.ListModelMixin,
         GenericViewSet
     ):
-    queryset = ProjectCategory.objects.all()
+    queryset = ProjectCategory.objects.prefetch_related("translations")
     serializer_class = ProjectCategorySerializer
 
 
 class FreelancerCategoryListViewSet(
+        CategoryTreeMixin,
         mixins.ListModelMixin,
         GenericViewSet
     ):
-    queryset = FreelancerCategory.objects.all()
+    queryset = FreelancerCategory.objects.prefetch_related("translations")
     serializer_class = FreelancerCategorySerializer
 
 
@@ -235,6 +377,14 @@ class WorkerTypeListViewSet(
 
 class ProjectCreateUpdateViewSet(ModelViewSet):
     queryset = Project.objects.all()
+    pagination_class = ProjectCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProjectFilter
+
+    def get_queryset(self):
+        return super().get_queryset() \
+            .select_related("client", "project_category", "freelancer_category") \
+            .prefetch_related("tags", "photos", "files")
     
     def get_serializer_class(self):
         if self.action in ["create", "update", "partial_update"]:
@@ -245,13 +395,129 @@ class ProjectCreateUpdateViewSet(ModelViewSet):
     def create(self, request, *args, **kwargs):
         serialized = self.get_serializer(data=request.data)
         serialized.is_valid(raise_exception=True)
-        files = serialized.validated_data.pop("files", None)
         project = serialized.save()
 
-        if files:
-            for file in files:
-                ProjectFile(file=file.file, project=project).save()
-        
         serializer = ProjectGetSerializer(project)
 
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter("q", openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Search query"),
+            openapi.Parameter("limit", openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter("offset", openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ]
+    )
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        query = request.query_params.get("q", "").strip()
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), 100)
+            offset = max(int(request.query_params.get("offset", 0)), 0)
+        except ValueError:
+            limit, offset = 20, 0
+
+        hits = get_project_search().search(query, get_language(), limit, offset) if query else []
+        projects = self.get_queryset().in_bulk([hit.id for hit in hits])
+        results = []
+        for hit in hits:
+            if hit.id not in projects:
+                continue
+            data = ProjectGetSerializer(projects[hit.id], context=self.get_serializer_context()).data
+            data["rank"] = hit.rank
+            data["highlight"] = {
+                "title": hit.title,
+                "description": hit.description
+            }
+            results.append(data)
+        return Response(
+            {
+                "limit": limit,
+                "offset": offset,
+                "results": results
+            }
+        )
+
+    @action(detail=False, methods=["get"], url_path="facets")
+    def facets(self, request):
+        result = {}
+        for facet in ["project_category", "freelancer_category", "worker_type"]:
+            # Each facet ignores its own filter so the client can offer the alternatives
+            data = request.query_params.copy()
+            data.pop(facet, None)
+            filterset = ProjectFilter(data, queryset=Project.objects.all(), request=request)
+            if not filterset.is_valid():
+                raise translate_validation(filterset.errors)
+            result[facet] = list(
+                filterset.qs.order_by()
+                .values(value=F(facet))
+                .annotate(count=Count("id"))
+                .order_by("-count", "value")
+            )
+        return Response(result)
+
+
+class ExportView(APIView):
+    """
+    Streams every row as NDJSON or CSV, optionally gzipped, without
+    holding more than one chunk of rows in memory.
+    """
+    permission_classes = [IsSuperUser]
+    kind = None
+
+    def get_queryset(self, request):
+        return None
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter("output", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(FORMATS), default="ndjson"),
+            openapi.Parameter("gzip", openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN),
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get("output", "ndjson")
+        if output not in FORMATS:
+            return Response(
+                {
+                    "status": False,
+                    "detail": EXPORT_UNKNOWN_FORMAT
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        gzip = request.query_params.get("gzip") in ("1", "true")
+        content_type, extension = FORMATS[output]
+        filename = "{}.{}".format(self.kind, extension)
+        if gzip:
+            content_type = "application/gzip"
+            filename += ".gz"
+        response = StreamingHttpResponse(
+            export_stream(self.kind, output, gzip, self.get_queryset(request)),
+            content_type=content_type
+        )
+        response["Content-Disposition"] = 'attachment; filename="{}"'.format(filename)
+        return response
+
+
+class ProjectExportView(ExportView):
+    kind = "projects"
+
+    def get_queryset(self, request):
+        filterset = ProjectFilter(request.query_params, queryset=Project.objects.all(), request=request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return filterset.qs
+
+
+class ClientExportView(ExportView):
+    kind = "clients"
+
+
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    if not token:
+        # Open only in development, production needs METRICS_TOKEN first
+        if not settings.DEBUG:
+            raise Http404
+    elif not constant_time_compare(request.headers.get("Authorization", ""), "Bearer {}".format(token)):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(metrics_store.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
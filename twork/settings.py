@@ -1,6 +1,7 @@
 from pathlib import Path
 import environ
 import os
+import tempfile
 from django.utils.translation import gettext_lazy as _
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -32,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
+    "api.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
@@ -125,4 +128,96 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 SWAGGER_SETTINGS = {
    "DEFAULT_INFO": "twork.urls.api_info",
-}
\ No newline at end of file
+}
+
+OTP_SMS_BACKEND = env("OTP_SMS_BACKEND", default="api.sms.StubSmsBackend")
+OTP_SMS_STUB_LATENCY = env.float("OTP_SMS_STUB_LATENCY", default=0)
+OTP_DISPATCH_IN_PROCESS = env.bool("OTP_DISPATCH_IN_PROCESS", default=True)
+OTP_DISPATCH_WORKERS = env.int("OTP_DISPATCH_WORKERS", default=2)
+OTP_DISPATCH_BATCH_SIZE = env.int("OTP_DISPATCH_BATCH_SIZE", default=50)
+OTP_DISPATCH_MAX_ATTEMPTS = env.int("OTP_DISPATCH_MAX_ATTEMPTS", default=5)
+OTP_DISPATCH_BACKOFF = env.int("OTP_DISPATCH_BACKOFF", default=2)
+OTP_DISPATCH_MAX_BACKOFF = env.int("OTP_DISPATCH_MAX_BACKOFF", default=300)
+OTP_DISPATCH_LEASE = env.int("OTP_DISPATCH_LEASE", default=60)
+OTP_DISPATCH_POLL_INTERVAL = env.float("OTP_DISPATCH_POLL_INTERVAL", default=5)
+
+# Throttle counters and token epochs live in the default cache, every worker has to share it
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+    "local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "local",
+    },
+}
+
+OTP_LIFETIME = env.int("OTP_LIFETIME", default=60)
+OTP_STORAGE = env("OTP_STORAGE", default="api.otp_store.DatabaseOtpStore")
+OTP_CACHE_ALIAS = "default"
+OTP_CACHE_RETENTION = env.int("OTP_CACHE_RETENTION", default=300)
+OTP_MAX_ATTEMPTS = env.int("OTP_MAX_ATTEMPTS", default=5)
+
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "api.authentication.ClaimsJWTAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "otp_create_phone": env("THROTTLE_OTP_CREATE_PHONE", default="3/min"),
+        "otp_create_ip": env("THROTTLE_OTP_CREATE_IP", default="30/min"),
+        "otp_validate_object": env("THROTTLE_OTP_VALIDATE_OBJECT", default="5/min"),
+        "otp_validate_ip": env("THROTTLE_OTP_VALIDATE_IP", default="60/min"),
+    },
+    # Reverse proxies in front of the app, X-Forwarded-For is ignored without them
+    "NUM_PROXIES": env.int("NUM_PROXIES", default=0),
+}
+
+SEARCH_CONFIGS = {
+    "ru": "russian",
+    "uz": "simple",
+}
+
+LOGIN_HASH_WORKERS = env.int("LOGIN_HASH_WORKERS", default=2)
+LOGIN_HASH_MAX_PENDING = env.int("LOGIN_HASH_MAX_PENDING", default=16)
+
+AUTH_USER_CACHE_ALIAS = "local"
+AUTH_USER_CACHE_TIMEOUT = env.int("AUTH_USER_CACHE_TIMEOUT", default=30)
+
+REVOCATION_BLOOM_ERROR_RATE = env.float("REVOCATION_BLOOM_ERROR_RATE", default=0.01)
+REVOCATION_BLOOM_MIN_CAPACITY = env.int("REVOCATION_BLOOM_MIN_CAPACITY", default=100000)
+REVOCATION_SYNC_INTERVAL = env.float("REVOCATION_SYNC_INTERVAL", default=5)
+REVOCATION_SYNC_OVERLAP = env.int("REVOCATION_SYNC_OVERLAP", default=60)
+REVOCATION_REBUILD_INTERVAL = env.int("REVOCATION_REBUILD_INTERVAL", default=3600)
+
+UPLOAD_MAX_SIZE = env.int("UPLOAD_MAX_SIZE", default=2 * 1024 ** 3)
+UPLOAD_CHUNK_MAX_SIZE = env.int("UPLOAD_CHUNK_MAX_SIZE", default=16 * 1024 ** 2)
+UPLOAD_RUNNING_HASHES = env.int("UPLOAD_RUNNING_HASHES", default=1000)
+
+BLOB_DELETE_GRACE = env.int("BLOB_DELETE_GRACE", default=10)
+
+PHOTO_VARIANTS = {
+    "thumbnail": {"size": [320, 320], "crop": True, "quality": 80},
+    "web": {"size": [1600, 1600], "crop": False, "quality": 85},
+}
+PHOTO_VARIANTS_ON_SAVE = env.bool("PHOTO_VARIANTS_ON_SAVE", default=True)
+PHOTO_VARIANT_WORKERS = env.int("PHOTO_VARIANT_WORKERS", default=2)
+PHOTO_VARIANT_TIMEOUT = env.int("PHOTO_VARIANT_TIMEOUT", default=30)
+
+METRICS_SAMPLE_RATE = env.float("METRICS_SAMPLE_RATE", default=0.1)
+METRICS_DIR = env("METRICS_DIR", default=os.path.join(tempfile.gettempdir(), "twork-metrics"))
+METRICS_FLUSH_INTERVAL = env.float("METRICS_FLUSH_INTERVAL", default=5)
+METRICS_RETENTION = env.int("METRICS_RETENTION", default=86400)
+# /metrics is not served without a token unless DEBUG is on
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
+PROFILE_SAMPLE_RATE = env.float("PROFILE_SAMPLE_RATE", default=0)
+PROFILE_DIR = env("PROFILE_DIR", default=os.path.join(tempfile.gettempdir(), "twork-profiles"))
+PROFILE_MAX_PER_ROUTE = env.int("PROFILE_MAX_PER_ROUTE", default=50)
+PROFILE_TOKEN_MAX_AGE = env.int("PROFILE_TOKEN_MAX_AGE", default=3600)
+
+SLOW_QUERY_THRESHOLD = env.float("SLOW_QUERY_THRESHOLD", default=200)
+SLOW_QUERY_EXPLAIN = env.bool("SLOW_QUERY_EXPLAIN", default=True)
+SLOW_QUERY_EXPLAIN_ANALYZE = env.bool("SLOW_QUERY_EXPLAIN_ANALYZE", default=False)
+SLOW_QUERY_LOG = env("SLOW_QUERY_LOG", default=os.path.join(tempfile.gettempdir(), "twork-slow-queries.jsonl"))
+SLOW_QUERY_LOG_MAX_BYTES = env.int("SLOW_QUERY_LOG_MAX_BYTES", default=50 * 1024 ** 2)
+
+EXPORT_CHUNK_SIZE = env.int("EXPORT_CHUNK_SIZE", default=2000)
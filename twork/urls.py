@@ -6,6 +6,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from api.views import metrics
+
 
 api_info = openapi.Info(
     title="Teamwork API",
@@ -25,6 +27,7 @@ urlpatterns = i18n_patterns(
 
 urlpatterns += [
     path("api/", include("api.urls")),
+    path("metrics", metrics, name="metrics"),
     path("swagger/", schema_view.with_ui("swagger", cache_timeout=0), name="schema-swagger-ui"),
 ]
 